@@ -0,0 +1,258 @@
+"""
+Benchmarks for the most expensive steps of the pre-processing.
+
+The benchmarks run on synthetic, German-like corpora of increasing size,
+such that they do not require any data. By default, they also use a blank
+German spaCy model, such that they do not require any model downloads.
+Note that a blank model has no tagger or parser, so the absolute numbers
+are not representative of de_core_news_lg; use --model to compare those.
+
+For each step, the throughput in documents and tokens per second
+and the peak memory allocated by Python during the step are reported.
+Except for the persistence of the caches, each step starts with
+empty caches, such that it does not benefit from the analyses
+of the previous steps. Steps that the model cannot run are reported
+as skipped.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --sizes 100 1000 10000
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import its_prep.spacy.props as nlp
+import its_prep.specs.pipelines as pipelines
+from its_prep.core import tokenize_documents
+from its_prep.specs.filters import get_props_by_document_frequency
+from its_prep.types import Document
+
+import spacy
+
+_articles = ["der", "die", "das", "ein", "eine", "dem", "den", "des"]
+_nouns = [
+    "Deutschland",
+    "Bundesstaat",
+    "Stadt",
+    "Einwohner",
+    "Fläche",
+    "Regierung",
+    "Klimazone",
+    "Naturpark",
+    "Schule",
+    "Lehrerin",
+    "Schüler",
+    "Unterricht",
+    "Mathematik",
+    "Geschichte",
+    "Video",
+    "Arbeitsblatt",
+    "Experiment",
+    "Sprache",
+]
+_verbs = ["ist", "hat", "liegt", "zeigt", "erklärt", "verfügt", "grenzt", "lernt"]
+_others = ["und", "in", "mit", "über", "sehr", "auch", "nicht", "als", "von", "zu"]
+
+
+def synthetic_texts(num_docs: int, seed: int = 0) -> list[str]:
+    """Create random German-like texts of varying length."""
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        words = [rng.choice(_articles).capitalize(), rng.choice(_nouns)]
+        words.append(rng.choice(_verbs))
+        for _ in range(rng.randint(2, 12)):
+            words.append(rng.choice(_others + _articles + _nouns))
+
+        return " ".join(words) + rng.choice([".", ".", "!", "?"])
+
+    return [
+        " ".join(sentence() for _ in range(rng.randint(1, 10))) for _ in range(num_docs)
+    ]
+
+
+@dataclass
+class Result:
+    name: str
+    num_docs: int
+    num_tokens: int
+    seconds: float
+    peak_bytes: Optional[int]
+    skipped: Optional[str] = None
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.num_docs / self.seconds if self.seconds > 0 else float("inf")
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.num_tokens / self.seconds if self.seconds > 0 else float("inf")
+
+    def __str__(self) -> str:
+        if self.skipped is not None:
+            return f"{self.name:<28} {self.num_docs:>8} docs skipped: {self.skipped}"
+
+        memory = (
+            f"{self.peak_bytes / 1024**2:10.1f} MiB"
+            if self.peak_bytes is not None
+            else "           n/a"
+        )
+        return (
+            f"{self.name:<28} {self.num_docs:>8} docs {self.seconds:>9.3f} s "
+            f"{self.docs_per_second:>12.1f} docs/s "
+            f"{self.tokens_per_second:>12.1f} tokens/s {memory}"
+        )
+
+
+def measure(
+    name: str,
+    fun: Callable[[], Any],
+    num_docs: int,
+    num_tokens: int,
+    trace_memory: bool = True,
+) -> tuple[Result, Any]:
+    """Run the function once, measuring its run-time and peak memory."""
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    value = fun()
+    seconds = time.perf_counter() - start
+
+    peak_bytes = None
+    if trace_memory:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return Result(name, num_docs, num_tokens, seconds, peak_bytes), value
+
+
+def run_benchmarks(
+    num_docs: int, batch_size: int = 256, trace_memory: bool = True
+) -> Iterator[Result]:
+    """Run all benchmarks on a synthetic corpus of the given size."""
+    texts = synthetic_texts(num_docs)
+    nlp.utils.clear_caches()
+
+    result, docs = measure(
+        "tokenize_documents",
+        lambda: list(
+            tokenize_documents(
+                texts, nlp.tokenize_as_words, batch_size=batch_size, language="de"
+            )
+        ),
+        num_docs,
+        0,
+        trace_memory=trace_memory,
+    )
+    num_tokens = sum(len(doc.original_tokens) for doc in docs)
+    result.num_tokens = num_tokens
+    yield result
+
+    def bench(name: str, fun: Callable[[], Any], fresh: bool = True) -> Result:
+        # do not benefit from the documents analyzed in previous steps
+        if fresh:
+            nlp.utils.clear_caches()
+            nlp.utils.reset_cache_stats()
+
+        result, _ = measure(name, fun, num_docs, num_tokens, trace_memory)
+        return result
+
+    yield bench(
+        "apply_poc_topic_modeling",
+        lambda: pipelines.apply_poc_topic_modeling(docs),
+    )
+    yield bench(
+        "document_frequency",
+        lambda: get_props_by_document_frequency(
+            docs, nlp.lemmatize_ids, min_num=5, max_rate=0.25
+        ),
+    )
+
+    # noun chunks require a dependency parser
+    if "parser" in nlp.utils.get_nlp().pipe_names:
+        yield bench("noun_chunks", lambda: _for_each(docs, nlp.noun_chunks))
+    else:
+        yield Result(
+            "noun_chunks",
+            num_docs,
+            num_tokens,
+            0.0,
+            None,
+            skipped="the model has no parser",
+        )
+
+    yield bench("into_sentences", lambda: _for_each(docs, nlp.into_sentences))
+
+    with tempfile.TemporaryDirectory() as directory:
+        # save the caches of the previous step
+        yield bench(
+            "save_caches",
+            lambda: nlp.utils.save_caches(Path(directory), file_prefix="bench"),
+            fresh=False,
+        )
+        yield bench(
+            "load_caches",
+            lambda: nlp.utils.load_caches(Path(directory), file_prefix="bench"),
+        )
+
+
+def _for_each(docs: list[Document], fun: Callable[[Document], Any]) -> None:
+    for doc in docs:
+        fun(doc)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 1_000, 10_000],
+        help="the numbers of documents of the synthetic corpora",
+    )
+    parser.add_argument(
+        "--model",
+        default="blank",
+        help="the spaCy model to load, or 'blank' for a blank German model",
+    )
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="do not trace the memory usage, which slows down the benchmarks",
+    )
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args(argv)
+
+    model = spacy.blank("de") if args.model == "blank" else spacy.load(args.model)
+    nlp.utils.set_nlp(model)
+
+    results: list[Result] = []
+    for num_docs in args.sizes:
+        for result in run_benchmarks(
+            num_docs, batch_size=args.batch_size, trace_memory=not args.no_memory
+        ):
+            print(result, flush=True)
+            results.append(result)
+
+    if args.json is not None:
+        with open(args.json, "w+") as f:
+            json.dump(
+                {"model": args.model, "results": [asdict(res) for res in results]},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,24 @@
-import its_prep.specs.collections as collections
-import its_prep.specs.pipelines as pipelines
-import its_prep.specs.filters as filters
+import importlib
 
 from its_prep.types import *
 from its_prep.core import *
+
+# the specs sub-modules depend on spaCy and are thus only imported on first use
+_lazy_submodules = {
+    "collections": "its_prep.specs.collections",
+    "pipelines": "its_prep.specs.pipelines",
+    "filters": "its_prep.specs.filters",
+}
+
+
+def __getattr__(name: str):
+    if name in _lazy_submodules:
+        module = importlib.import_module(_lazy_submodules[name])
+        globals()[name] = module
+        return module
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_lazy_submodules))
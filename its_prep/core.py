@@ -1,20 +1,204 @@
 """
 Core functionality, like applying filters or tokenizing documents.
 """
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
 from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
 from functools import partial
+from itertools import islice
+from multiprocessing.pool import AsyncResult
+from typing import Any, Optional
 
+import numpy as np
+from numpy.typing import DTypeLike
 from its_prep.types import (
+    Array_Property_Function,
     Document,
     Filter,
+    Mask_Function,
     Pipeline,
     Property,
     Property_Function,
+    Selection,
     Tokens,
+    detect_languages,
 )
 
 
-def apply_filters(docs: Iterable[Document], filters: Pipeline) -> Iterator[Document]:
+def describe_function(fun: Callable) -> str:
+    """A readable name of the function, including any partial applications."""
+    if isinstance(fun, partial):
+        args = [describe_function(arg) for arg in fun.args if callable(arg)]
+        return f"{describe_function(fun.func)}({', '.join(args)})"
+
+    return getattr(fun, "__qualname__", None) or repr(fun)
+
+
+@dataclass
+class Filter_Stats:
+    """Measurements of a single filter, accumulated over all documents."""
+
+    name: str
+    calls: int = 0
+    seconds: float = 0.0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    @property
+    def selectivity(self) -> float:
+        """The fraction of incoming tokens that were kept by the filter."""
+        return self.tokens_out / self.tokens_in if self.tokens_in > 0 else 1.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.calls} calls, {self.seconds:.3f} s, "
+            f"{self.tokens_in} -> {self.tokens_out} tokens "
+            f"({self.selectivity:.1%} kept)"
+        )
+
+
+class Pipeline_Stats:
+    """
+    Per-filter measurements of applied pipelines, see apply_filters.
+
+    The measurements are kept for each filter function, in the order
+    in which the filters were first applied.
+    To process the measurements differently, e.g. to forward them to a
+    monitoring system, override the record method.
+    """
+
+    def __init__(self) -> None:
+        self.filters: dict[Any, Filter_Stats] = dict()
+
+    def record(
+        self,
+        fun: Filter,
+        seconds: float,
+        tokens_in: int,
+        tokens_out: int,
+        calls: int = 1,
+    ) -> None:
+        """
+        Record a single application of the filter on a document.
+
+        :param calls: The number of applications, if the measurements
+                      were accumulated over multiple documents.
+        """
+        if fun not in self.filters:
+            self.filters[fun] = Filter_Stats(describe_function(fun))
+
+        stats = self.filters[fun]
+        stats.calls += calls
+        stats.seconds += seconds
+        stats.tokens_in += tokens_in
+        stats.tokens_out += tokens_out
+
+    def __iter__(self) -> Iterator[Filter_Stats]:
+        return iter(self.filters.values())
+
+    def __str__(self) -> str:
+        return "\n".join(str(stats) for stats in self)
+
+
+def _apply_instrumented(fun: Filter, stats: Pipeline_Stats, doc: Document) -> Document:
+    start = time.perf_counter()
+    result = fun(doc)
+    stats.record(fun, time.perf_counter() - start, len(doc), len(result))
+    return result
+
+
+def _fit_mask(mask: np.ndarray, num_tokens: int) -> np.ndarray:
+    """
+    Resize the mask to the number of original tokens.
+
+    As in Selection.from_mask, tokens without a mask value are not selected.
+    """
+    if len(mask) == num_tokens:
+        return mask
+
+    fitted = np.zeros(num_tokens, dtype=bool)
+    fitted[: min(len(mask), num_tokens)] = mask[:num_tokens]
+    return fitted
+
+
+def compile_pipeline(
+    filters: Pipeline, stats: Optional[Pipeline_Stats] = None
+) -> Filter:
+    """
+    Fuse the pipeline's Filter functions into a single Filter.
+
+    Filters that were defined through a token mask
+    (see its_prep.specs.filters.filter_from_mask) are evaluated as a single
+    boolean mask per document, such that the filtered document is only
+    created once, at the end.
+    Any other filters are applied as usual, on the document filtered by
+    all previous filters.
+    As for the unfused filters, tokens without a mask value
+    (e.g. because the property function merged tokens) are not selected.
+
+    :param stats: If given, record the measurements of each filter in it.
+                  For filters defined through a token mask, the tokens are
+                  counted on the mask.
+    """
+
+    def fused_fun(doc: Document) -> Document:
+        mask: Optional[np.ndarray] = None
+
+        for fun in filters:
+            mask_fun: Optional[Mask_Function] = getattr(fun, "mask", None)
+
+            # filters without masks require the filtered document
+            if mask_fun is None:
+                if mask is not None:
+                    doc = doc.sub_doc(Selection.from_mask(mask))
+                    mask = None
+
+                if stats is None:
+                    doc = fun(doc)
+                else:
+                    doc = _apply_instrumented(fun, stats, doc)
+                continue
+
+            if mask is None:
+                mask = doc.selected.to_mask(len(doc.original_tokens))
+
+            # no further filter can select any tokens again
+            if not mask.any():
+                break
+
+            if stats is None:
+                mask &= _fit_mask(mask_fun(doc), len(mask))
+                continue
+
+            tokens_in = int(np.count_nonzero(mask))
+            start = time.perf_counter()
+            mask &= _fit_mask(mask_fun(doc), len(mask))
+            stats.record(
+                fun,
+                time.perf_counter() - start,
+                tokens_in,
+                int(np.count_nonzero(mask)),
+            )
+
+        if mask is not None:
+            doc = doc.sub_doc(Selection.from_mask(mask))
+
+        return doc
+
+    return fused_fun
+
+
+def apply_filters(
+    docs: Iterable[Document],
+    filters: Pipeline,
+    fused: bool = False,
+    stats: Optional[Pipeline_Stats] = None,
+) -> Iterator[Document]:
     """
     Iteratively apply the pipeline's Filter functions on the given documents,
     interpreting the collections of indices returned by the filters as
@@ -22,7 +206,16 @@ def apply_filters(docs: Iterable[Document], filters: Pipeline) -> Iterator[Docum
     Tokens with index not inside a filter's result will be discarded.
 
     If no filters were given, the documents are returned as-is.
+
+    :param fused: Whether to fuse the filters into a single filter first.
+                  See compile_pipeline for more details.
+    :param stats: If given, record the run-time and the number of tokens
+                  before and after each filter in it.
     """
+    if fused:
+        filters = [compile_pipeline(filters, stats=stats)]
+    elif stats is not None:
+        filters = [partial(_apply_instrumented, fun, stats) for fun in filters]
 
     def apply_all(doc: Document, *filters: Filter) -> Document:
         """
@@ -41,17 +234,249 @@ def apply_filters(docs: Iterable[Document], filters: Pipeline) -> Iterator[Docum
         yield apply_all(doc, *filters)
 
 
+# the pipeline used by each worker process of apply_filters_parallel
+_worker_filters: Pipeline = []
+# the measurements of the worker's current chunk, if requested,
+# and the position of each filter within the pipeline
+_worker_stats: Optional[Pipeline_Stats] = None
+_worker_filter_indices: dict[Filter, int] = dict()
+
+
+def _init_worker(
+    filters: Pipeline,
+    fused: bool,
+    spacy_config: Optional[dict[str, Any]],
+    collect_stats: bool = False,
+) -> None:
+    global _worker_filters, _worker_stats, _worker_filter_indices
+    _worker_stats = Pipeline_Stats() if collect_stats else None
+    _worker_filter_indices = {fun: index for index, fun in enumerate(filters)}
+
+    if fused:
+        _worker_filters = [compile_pipeline(filters, stats=_worker_stats)]
+    elif _worker_stats is not None:
+        _worker_filters = [
+            partial(_apply_instrumented, fun, _worker_stats) for fun in filters
+        ]
+    else:
+        _worker_filters = filters
+
+    # analyze the texts like the parent process, e.g. with the same model
+    if spacy_config is not None:
+        import its_prep.spacy.utils as spacy_utils
+
+        spacy_utils.set_process_config(spacy_config)
+
+
+# the measurements of a filter: its position in the pipeline, the number of
+# calls, the seconds and the number of tokens before and after the filter
+_Worker_Stats = list[tuple[int, int, float, int, int]]
+
+
+def _apply_worker_filters(
+    docs: list[Document],
+) -> tuple[list[Document], _Worker_Stats]:
+    results = []
+    for doc in docs:
+        for fun in _worker_filters:
+            doc = fun(doc)
+
+        results.append(doc)
+
+    if _worker_stats is None:
+        return results, []
+
+    # the filters of the worker are copies, so they are sent by their position
+    stats = [
+        (
+            _worker_filter_indices[fun],
+            filter_stats.calls,
+            filter_stats.seconds,
+            filter_stats.tokens_in,
+            filter_stats.tokens_out,
+        )
+        for fun, filter_stats in _worker_stats.filters.items()
+    ]
+    _worker_stats.filters.clear()
+    return results, stats
+
+
+def _chunks(docs: Iterable[Document], chunksize: int) -> Iterator[list[Document]]:
+    docs = iter(docs)
+    while chunk := list(islice(docs, chunksize)):
+        yield chunk
+
+
+def apply_filters_parallel(
+    docs: Iterable[Document],
+    filters: Pipeline,
+    n_jobs: Optional[int] = None,
+    chunksize: int = 64,
+    ordered: bool = True,
+    fused: bool = False,
+    max_pending_chunks: Optional[int] = None,
+    stats: Optional[Pipeline_Stats] = None,
+) -> Iterator[Document]:
+    """
+    Apply the pipeline's Filter functions like apply_filters,
+    but distribute the documents onto multiple worker processes.
+
+    The filters are sent to each worker once, so they must be picklable.
+    This is the case for the filters created in its_prep.specs.filters,
+    as long as the property functions they are based on can be pickled,
+    e.g. those in its_prep.spacy.props.
+    Each worker loads its own spaCy model on first use
+    and keeps it for all of the documents it processes.
+    If the spaCy analysis was configured in this process, e.g. through
+    set_nlp, only_components or use_shared_caches of its_prep.spacy.utils,
+    the workers are configured in the same way.
+
+    The documents are read lazily: only a bounded number of chunks
+    is sent to the workers ahead of the returned documents.
+
+    :param n_jobs: The number of worker processes.
+                   Defaults to the number of available CPUs.
+    :param chunksize: The number of documents sent to a worker at once.
+    :param ordered: Whether to return the documents in their input order.
+                    Otherwise, documents are returned as soon as they are done.
+    :param fused: Whether to fuse the filters into a single filter first.
+                  See compile_pipeline for more details.
+    :param max_pending_chunks: The maximum number of chunks that are sent
+                               to the workers, but not yet returned.
+                               Defaults to twice the number of workers.
+    :param stats: If given, record the measurements of each filter in it,
+                  as in apply_filters. The workers measure the filters
+                  and send their measurements along with each chunk.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    max_pending_chunks = max_pending_chunks or 2 * n_jobs
+
+    # only the configuration of an already imported module needs to be sent
+    spacy_utils = sys.modules.get("its_prep.spacy.utils")
+    spacy_config = (
+        spacy_utils.get_process_config(
+            include_model=multiprocessing.get_start_method() != "fork"
+        )
+        if spacy_utils is not None
+        else None
+    )
+
+    with multiprocessing.Pool(
+        processes=n_jobs,
+        initializer=_init_worker,
+        initargs=(filters, fused, spacy_config, stats is not None),
+    ) as pool:
+
+        def collect(result: tuple[list[Document], _Worker_Stats]) -> list[Document]:
+            results, worker_stats = result
+            if stats is not None:
+                for index, calls, seconds, tokens_in, tokens_out in worker_stats:
+                    stats.record(filters[index], seconds, tokens_in, tokens_out, calls)
+
+            return results
+
+        chunks = _chunks(docs, chunksize)
+        if ordered:
+            pending: deque[AsyncResult] = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_apply_worker_filters, (chunk,)))
+                if len(pending) >= max_pending_chunks:
+                    yield from collect(pending.popleft().get())
+
+            while pending:
+                yield from collect(pending.popleft().get())
+            return
+
+        # the results of the chunks, in the order in which they are finished
+        finished: queue.SimpleQueue = queue.SimpleQueue()
+
+        def next_finished() -> list[Document]:
+            result = finished.get()
+            if isinstance(result, BaseException):
+                raise result
+
+            return collect(result)
+
+        num_pending = 0
+        for chunk in chunks:
+            pool.apply_async(
+                _apply_worker_filters,
+                (chunk,),
+                callback=finished.put,
+                error_callback=finished.put,
+            )
+            num_pending += 1
+            if num_pending >= max_pending_chunks:
+                yield from next_finished()
+                num_pending -= 1
+
+        for _ in range(num_pending):
+            yield from next_finished()
+
+
+def _with_detected_languages(
+    raw_docs: Iterable[str], batch_size: int
+) -> Iterator[tuple[str, Optional[str]]]:
+    raw_docs = iter(raw_docs)
+    while batch := list(islice(raw_docs, batch_size)):
+        yield from zip(batch, detect_languages(batch))
+
+
 def tokenize_documents(
-    raw_docs: Iterable[str], tokenize_fun: Callable[[str], Tokens], **kwargs
+    raw_docs: Iterable[str],
+    tokenize_fun: Callable[[str], Tokens],
+    batch_size: Optional[int] = None,
+    n_process: int = 1,
+    language: Optional[str] = None,
+    lazy_language: bool = False,
+    compact: bool = False,
+    **kwargs,
 ) -> Iterator[Document]:
     """
     Create Document objects from raw text, using the given tokenizer.
 
     Any additional keyword arguments are passed onto the tokenization function.
+
+    :param batch_size: If given, analyze the raw texts with spaCy in batches
+                       of this size before tokenizing them.
+                       This is only useful for tokenizers that are based on
+                       the cached spaCy analysis, e.g. those in its_prep.spacy.
+                       The documents are still returned lazily and in order.
+    :param n_process: The number of processes to use for batched analysis.
+    :param language: The language of all documents, if known.
+                     Otherwise, it is detected for each batch of documents
+                     (of batch_size, or 64 documents by default),
+                     see its_prep.types.detect_languages.
+    :param lazy_language: Whether to only detect the language of a document
+                          once it is first accessed.
+    :param compact: Whether to store the tokens of all documents in a shared
+                    vocabulary, see its_prep.types.intern_tokens.
+                    This reduces the memory usage of large corpora.
     """
     tokenize_fun = partial(tokenize_fun, **kwargs)
-    for raw_doc in raw_docs:
-        yield Document.fromtext(raw_doc, tokenize_fun=tokenize_fun)
+
+    if batch_size is not None:
+        import its_prep.spacy.utils as spacy_utils
+
+        raw_docs = spacy_utils.pipe_texts(
+            raw_docs, batch_size=batch_size, n_process=n_process
+        )
+
+    if language is not None or lazy_language:
+        with_languages: Iterable[tuple[str, Optional[str]]] = (
+            (raw_doc, language) for raw_doc in raw_docs
+        )
+    else:
+        with_languages = _with_detected_languages(raw_docs, batch_size or 64)
+
+    for raw_doc, doc_language in with_languages:
+        yield Document.fromtext(
+            raw_doc,
+            tokenize_fun=tokenize_fun,
+            language=doc_language,
+            lazy_language=lazy_language,
+            compact=compact,
+        )
 
 
 def selected_properties(
@@ -62,6 +487,66 @@ def selected_properties(
     """
     for doc in docs:
         props = property_fun(doc)
-        yield tuple(
-            prop for token, prop in zip(doc, props) if token in doc.selected_tokens
-        )
+        yield tuple(props[index] for index in _selected_indices(doc, len(props)))
+
+
+def _selected_indices(doc: Document, num_props: int) -> np.ndarray:
+    """The sorted indices of the selected tokens that have a property."""
+    indices = doc.selected.indices
+    return indices[indices < num_props]
+
+
+def selected_property_arrays(
+    docs: Iterable[Document],
+    property_fun: Property_Function[Property] | Array_Property_Function,
+    dtype: Optional[DTypeLike] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Like selected_properties, but return the properties as NumPy arrays.
+
+    Properties that are themselves arrays, e.g. word vectors,
+    are stacked into one row per selected token.
+
+    :param dtype: The data type of the arrays.
+                  By default, it is inferred from the properties.
+    """
+    for doc in docs:
+        props = np.asarray(property_fun(doc), dtype=dtype)
+        yield props[_selected_indices(doc, len(props))]
+
+
+def flat_selected_properties(
+    docs: Iterable[Document],
+    property_fun: Property_Function[Property] | Array_Property_Function,
+    dtype: Optional[DTypeLike] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Collect the properties of all selected tokens into a single array.
+
+    The properties of the i-th document are given by
+    values[offsets[i] : offsets[i + 1]].
+
+    :param dtype: The data type of the values.
+                  By default, it is inferred from the properties.
+    :return: The concatenated values and the offsets of each document,
+             with one more offset than there are documents.
+    """
+    arrays = list(selected_property_arrays(docs, property_fun, dtype=dtype))
+
+    lengths = np.fromiter(
+        (len(array) for array in arrays), dtype=np.int64, count=len(arrays)
+    )
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # empty arrays may not have the inferred dtype of the others
+    non_empty = [array for array in arrays if len(array) > 0]
+    if not non_empty:
+        if not arrays:
+            return np.array([], dtype=dtype), offsets
+
+        # keep the shape of array-valued properties, e.g. (0, dim) for vectors
+        template = max(arrays, key=np.ndim)
+        return np.empty((0, *template.shape[1:]), dtype=template.dtype), offsets
+
+    return np.concatenate(non_empty), offsets
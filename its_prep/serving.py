@@ -0,0 +1,247 @@
+"""
+An asyncio front end for pre-processing texts within online services.
+
+Concurrent requests are collected into micro-batches, which are analyzed
+and filtered at once in a separate thread, such that the event loop is not
+blocked and the texts are analyzed by spaCy in batches, rather than alone.
+"""
+import asyncio
+import threading
+import weakref
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Optional
+
+from its_prep.core import apply_filters, tokenize_documents
+from its_prep.types import Document, Pipeline, Tokens
+
+
+def _default_tokenize_fun() -> Callable[[str], Tokens]:
+    import its_prep.spacy.props as nlp
+
+    return nlp.tokenize_as_words
+
+
+# the caches of the spaCy analysis are not thread-safe. Thus, all batchers
+# process their batches in the same thread by default, and one at a time
+_executor: Optional[ThreadPoolExecutor] = None
+_processing_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="its-prep")
+
+    return _executor
+
+
+class Micro_Batcher:
+    """
+    Pre-process texts with a fixed pipeline, collecting concurrent requests
+    into micro-batches.
+
+    A batch is processed once it contains max_batch_size texts, or once
+    max_wait seconds have passed since its first text arrived. While a batch
+    is being processed, new requests are queued for the next one.
+
+    Batches are processed one at a time, across all batchers, because the
+    caches of the spaCy analysis are not thread-safe. The batcher is bound
+    to the event loop that it is first used within.
+
+    :param pipeline: The filters to apply on each tokenized document.
+    :param tokenize_fun: The tokenizer to create the documents with.
+                         By default, its_prep.spacy.props.tokenize_as_words.
+    :param max_batch_size: The maximum number of texts per batch.
+    :param max_wait: The maximum number of seconds to wait for further texts
+                     before processing a batch.
+    :param executor: Where to process the batches. By default, in a thread
+                     that is shared by all batchers.
+    :param fused: Whether to fuse the filters. See its_prep.core.apply_filters.
+    :param batch_analysis: Whether to analyze each batch through nlp.pipe.
+                           Only useful for tokenizers based on the cached
+                           spaCy analysis. See its_prep.core.tokenize_documents.
+    Any additional keyword arguments are passed onto tokenize_documents.
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        tokenize_fun: Optional[Callable[[str], Tokens]] = None,
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+        executor: Optional[Executor] = None,
+        fused: bool = False,
+        batch_analysis: bool = True,
+        **kwargs,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait < 0:
+            raise ValueError("max_wait must not be negative")
+
+        self.pipeline = list(pipeline)
+        self.tokenize_fun = tokenize_fun or _default_tokenize_fun()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.fused = fused
+        self.batch_analysis = batch_analysis
+        self.kwargs = kwargs
+
+        self._executor = executor or _get_executor()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def preprocess(self, text: str) -> Document:
+        """Tokenize and filter the text, as part of the next micro-batch."""
+        if self._closed:
+            raise RuntimeError("The batcher has already been closed")
+
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+        assert self._queue is not None
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def close(self) -> None:
+        """Process all queued requests, then stop the batcher."""
+        if self._closed:
+            return
+
+        self._closed = True
+        if self._worker is not None and self._queue is not None:
+            self._queue.put_nowait(None)
+            await self._worker
+
+    async def __aenter__(self) -> "Micro_Batcher":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # requests that were cancelled in the meantime are skipped
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._process_batch, texts
+                )
+            except Exception as e:
+                results = [e for _ in batch]
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _process(self, texts: list[str], batch_size: Optional[int]) -> list[Document]:
+        docs = tokenize_documents(
+            texts, self.tokenize_fun, batch_size=batch_size, **self.kwargs
+        )
+        return list(apply_filters(docs, self.pipeline, fused=self.fused))
+
+    def _process_batch(self, texts: list[str]) -> list[Document | BaseException]:
+        """
+        Process the texts at once. If this fails, process them one at a time,
+        such that the failure is only reported for the offending texts.
+        """
+        # custom executors may run batches of different batchers concurrently
+        with _processing_lock:
+            batch_size = len(texts) if self.batch_analysis else None
+            try:
+                return list(self._process(texts, batch_size))
+            except Exception as e:
+                if len(texts) == 1:
+                    return [e]
+
+            results: list[Document | BaseException] = []
+            for text in texts:
+                try:
+                    results.extend(self._process([text], None))
+                except Exception as e:
+                    results.append(e)
+
+            return results
+
+
+# the batchers used by preprocess, for each event loop,
+# ordered from the least to the most recently used one
+_batchers: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple, Micro_Batcher]
+] = weakref.WeakKeyDictionary()
+
+# the maximum number of batchers per event loop used by preprocess
+_MAX_BATCHERS = 16
+
+# batchers that are being closed, such that their tasks are not collected
+_closing: set[asyncio.Task] = set()
+
+
+async def preprocess(
+    text: str,
+    pipeline: Pipeline,
+    tokenize_fun: Optional[Callable[[str], Tokens]] = None,
+) -> Document:
+    """
+    Tokenize and filter the text without blocking the event loop.
+
+    Concurrent calls with the same pipeline and tokenizer share a Micro_Batcher
+    with its default settings. Filters are compared by identity, so the
+    pipeline should be created once, rather than for each request.
+    Only the most recently used batchers are kept; the others are closed.
+    Use a Micro_Batcher directly to configure it.
+    """
+    loop = asyncio.get_running_loop()
+    loop_batchers = _batchers.setdefault(loop, dict())
+    key = (tuple(pipeline), tokenize_fun)
+
+    batcher = loop_batchers.pop(key, None)
+    if batcher is None:
+        batcher = Micro_Batcher(pipeline, tokenize_fun=tokenize_fun)
+
+    # mark the batcher as the most recently used one
+    loop_batchers[key] = batcher
+    while len(loop_batchers) > _MAX_BATCHERS:
+        evicted = loop_batchers.pop(next(iter(loop_batchers)))
+        task = loop.create_task(evicted.close())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+    return await batcher.preprocess(text)
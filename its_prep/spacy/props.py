@@ -11,11 +11,14 @@ Note that even though these functions are defined on
 spaCy-specific document representations,
 they will actually act on the internal Document representation.
 """
+from collections.abc import Sequence
+
 import its_prep.spacy.utils as utils
 import numpy as np
-from its_prep.types import Tokens
+from its_prep.types import Document, Tokens
 from thinc.types import Floats1d
 
+import spacy.attrs
 import spacy.tokens
 
 
@@ -47,6 +50,21 @@ def get_word_vectors(processed_doc: spacy.tokens.Doc) -> list[Floats1d]:
 
 
 @utils.property_from_doc
+def get_word_vector_matrix(processed_doc: spacy.tokens.Doc) -> np.ndarray:
+    """
+    The word vector of each token, as a matrix with one row per token.
+
+    See its_prep.spacy.vectors for the vectors of entire corpora.
+    """
+    # like spaCy, use the context-sensitive tensor if the model has no vectors
+    if processed_doc.vocab.vectors.size == 0 and processed_doc.tensor.size != 0:
+        return processed_doc.tensor
+
+    return utils.vectors_of_ids(processed_doc.to_array(spacy.attrs.ORTH))
+
+
+@utils.property_from_doc
+@utils.requires_components(*utils.POS_COMPONENTS)
 def get_upos(processed_doc: spacy.tokens.Doc) -> list[str]:
     """The universal POS tags of each token"""
     return [token.pos_ for token in processed_doc]
@@ -59,55 +77,117 @@ def is_stop(processed_doc: spacy.tokens.Doc) -> list[bool]:
 
 
 @utils.property_from_doc
+@utils.requires_components(*utils.LEMMA_COMPONENTS)
 def lemmatize(processed_doc: spacy.tokens.Doc) -> list[str]:
     """The lemmatized version of each token"""
     return [token.lemma_ for token in processed_doc]
 
 
-@utils.sentencizer_from_doc
-def into_sentences(processed_doc: spacy.tokens.Doc) -> list[list[str]]:
-    """Split the document by its sentences"""
-    return [[token.text for token in sent] for sent in processed_doc.sents]
+@utils.property_from_doc
+@utils.requires_components(*utils.POS_COMPONENTS)
+def get_upos_ids(processed_doc: spacy.tokens.Doc) -> np.ndarray:
+    """
+    The universal POS tags of each token, as spaCy IDs.
 
+    Use utils.string_ids to obtain the IDs of particular tags.
+    """
+    return processed_doc.to_array(spacy.attrs.POS)
 
-@utils.sentencizer_from_doc
-def into_sentences_lemmatized(
-    processed_doc: spacy.tokens.Doc,
-) -> list[list[str]]:
-    """Split the document by its sentences, with lemmatization"""
-    return [[token.lemma_ for token in sent] for sent in processed_doc.sents]
+
+@utils.property_from_doc
+def is_stop_array(processed_doc: spacy.tokens.Doc) -> np.ndarray:
+    """Boolean array indicating whether each token is a stop word"""
+    return processed_doc.to_array(spacy.attrs.IS_STOP).astype(bool)
 
 
 @utils.property_from_doc
-def noun_chunks(processed_doc: spacy.tokens.Doc) -> list[int | None]:
+@utils.requires_components(*utils.LEMMA_COMPONENTS)
+def lemmatize_ids(processed_doc: spacy.tokens.Doc) -> np.ndarray:
     """
-    Annotate the given tokens with the noun chunks they belong to.
+    The lemmatized version of each token, as spaCy IDs.
 
-    If a token does not belong to a noun chunk, it is assigned None.
-    NOTE: the given document has to have been tokenized by spaCy!
+    Use utils.string_ids to obtain the IDs of particular lemmas.
     """
-    chunks = list(processed_doc.noun_chunks)
+    return processed_doc.to_array(spacy.attrs.LEMMA)
 
-    if len(chunks) == 0:
-        return [None for _ in processed_doc]
 
-    res: list[int | None] = []
-    cur_chunk = 0
-    chunk_was_visited = [False for _ in chunks]
-    for token in processed_doc:
-        # all noun chunks have been searched through
-        if cur_chunk >= len(chunks):
-            res.append(None)
-            continue
+@utils.property_from_doc
+def get_token_texts(processed_doc: spacy.tokens.Doc) -> list[str]:
+    """The text of each token"""
+    return [token.text for token in processed_doc]
 
-        if token in chunks[cur_chunk]:
-            res.append(cur_chunk)
-            chunk_was_visited[cur_chunk] = True
-            continue
 
-        if chunk_was_visited[cur_chunk]:
-            cur_chunk += 1
+@utils.splits_at(utils.get_sentence_offsets)
+@utils.requires_components(*utils.SENTER_COMPONENTS)
+def into_sentences(doc: Document) -> list[Sequence[str]]:
+    """Split the document by its sentences"""
+    return utils.split_by_sentences(get_token_texts, doc)
 
-        res.append(None)
 
+@utils.splits_at(utils.get_sentence_offsets)
+@utils.requires_components(*utils.LEMMA_COMPONENTS, *utils.SENTER_COMPONENTS)
+def into_sentences_lemmatized(doc: Document) -> list[Sequence[str]]:
+    """Split the document by its sentences, with lemmatization"""
+    return utils.split_by_sentences(lemmatize, doc)
+
+
+def _noun_chunk_id_array(processed_doc: spacy.tokens.Doc) -> np.ndarray:
+    num_tokens = len(processed_doc)
+    if num_tokens == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    chunks = processed_doc.noun_chunks
+    bounds = np.fromiter(
+        (bound for span in chunks for bound in (span.start, span.end)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    starts, ends = bounds[:, 0], bounds[:, 1]
+    lengths = ends - starts
+
+    # the positions of all tokens of all chunks, and the chunks they belong to
+    num_chunk_tokens = int(lengths.sum())
+    chunk_ids = np.repeat(np.arange(len(starts), dtype=np.int64), lengths)
+    chunk_offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = (
+        np.arange(num_chunk_tokens, dtype=np.int64)
+        - chunk_offsets
+        + np.repeat(starts, lengths)
+    )
+
+    # tokens in overlapping chunks belong to the first of them.
+    # no chunk ID equals the number of chunks, which marks tokens outside them
+    no_chunk = len(starts)
+    res = np.full(num_tokens, no_chunk, dtype=np.int64)
+    np.minimum.at(res, positions, chunk_ids)
+    res[res == no_chunk] = -1
     return res
+
+
+@utils.property_from_doc
+@utils.requires_components(*utils.PARSER_COMPONENTS)
+def noun_chunk_ids(processed_doc: spacy.tokens.Doc) -> np.ndarray:
+    """
+    The IDs of the noun chunks that each token belongs to, as an integer array.
+
+    The chunks are numbered in order of the document.
+    Tokens that do not belong to a noun chunk are assigned -1.
+    Tokens that belong to overlapping chunks are assigned the first of them.
+    NOTE: the given document has to have been tokenized by spaCy!
+    """
+    return _noun_chunk_id_array(processed_doc)
+
+
+@utils.property_from_doc
+@utils.requires_components(*utils.PARSER_COMPONENTS)
+def noun_chunks(processed_doc: spacy.tokens.Doc) -> list[int | None]:
+    """
+    Annotate the given tokens with the noun chunks they belong to.
+
+    If a token does not belong to a noun chunk, it is assigned None.
+    See noun_chunk_ids for an array-valued version.
+    NOTE: the given document has to have been tokenized by spaCy!
+    """
+    return [
+        None if chunk_id < 0 else chunk_id
+        for chunk_id in _noun_chunk_id_array(processed_doc).tolist()
+    ]
@@ -0,0 +1,256 @@
+"""
+A columnar, memory-mapped store of per-token properties on disk.
+
+Writing the store analyzes each document with spaCy once.
+Afterwards, opening the store only maps its files into memory,
+such that the properties of stored documents can be read without copying
+them, deserializing spaCy documents or loading the spaCy model.
+
+Each property is stored as one flat column over the tokens of all documents,
+together with the offsets at which each document starts.
+String-valued properties (tokens and lemmas) are stored as their spaCy IDs,
+see its_prep.spacy.utils.string_ids.
+"""
+from __future__ import annotations
+
+import json
+import pickle
+from collections.abc import Callable, Iterable, Sequence
+from functools import cached_property, partial
+from pathlib import Path
+from typing import Optional
+
+import its_prep.spacy.props as props
+import its_prep.spacy.utils as utils
+import numpy as np
+from its_prep.types import Array_Property_Function, Document, Split_Function
+
+import spacy.attrs
+import spacy.tokens
+
+# the stored columns and their data types
+COLUMNS: dict[str, type] = {
+    "tokens": np.uint64,
+    "lemma": np.uint64,
+    "pos": np.uint64,
+    "is_stop": np.bool_,
+    "sent_start": np.bool_,
+}
+
+
+def _store_key(doc: Document) -> int:
+    """The lower 64 bits of the document's content digest."""
+    return doc.digest & 0xFFFF_FFFF_FFFF_FFFF
+
+
+def _token_ids(doc: Document) -> np.ndarray:
+    return utils.string_ids(doc.original_tokens)
+
+
+def _sent_starts(doc: Document) -> np.ndarray:
+    offsets = utils.get_sentence_offsets(doc)
+    sent_starts = np.zeros(offsets[-1], dtype=bool)
+    sent_starts[offsets[:-1]] = True
+    return sent_starts
+
+
+# how to compute each column for documents that are not in the store
+_column_funs: dict[str, Array_Property_Function] = {
+    "tokens": _token_ids,
+    "lemma": props.lemmatize_ids,
+    "pos": props.get_upos_ids,
+    "is_stop": props.is_stop_array,
+    "sent_start": _sent_starts,
+}
+
+
+def write_store(directory: Path, docs: Iterable[Document]) -> Property_Store:
+    """
+    Analyze the given documents and write their properties into a new store.
+
+    The documents are processed one at a time, so they may also be streamed.
+    Documents with the same contents are only stored once.
+    Any existing store in the directory is overwritten.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+
+    keys: dict[int, int] = dict()
+    lengths: list[int] = []
+    strings: dict[int, str] = dict()
+
+    files = {column: open(directory / f"{column}.bin", "wb") for column in COLUMNS}
+    try:
+        for doc in docs:
+            key = _store_key(doc)
+            if key in keys:
+                continue
+
+            processed_doc = utils._ensure_components(
+                utils.document_into_spacy_doc(doc), utils.LEMMA_COMPONENTS
+            )
+            columns = {
+                "tokens": _token_ids(doc),
+                "lemma": processed_doc.to_array(spacy.attrs.LEMMA),
+                "pos": processed_doc.to_array(spacy.attrs.POS),
+                "is_stop": processed_doc.to_array(spacy.attrs.IS_STOP),
+                "sent_start": _sent_starts(doc),
+            }
+            for column, dtype in COLUMNS.items():
+                columns[column].astype(dtype, copy=False).tofile(files[column])
+
+            strings.update(zip(columns["tokens"].tolist(), doc.original_tokens))
+            strings.update((token.lemma, token.lemma_) for token in processed_doc)
+            strings.update((token.pos, token.pos_) for token in processed_doc)
+
+            keys[key] = len(lengths)
+            lengths.append(len(processed_doc))
+    finally:
+        for file in files.values():
+            file.close()
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.array(lengths, dtype=np.int64), out=offsets[1:])
+    offsets.tofile(directory / "offsets.bin")
+
+    # the keys are sorted, such that documents can be looked up by bisection
+    key_array = np.fromiter(keys.keys(), dtype=np.uint64, count=len(keys))
+    order = np.argsort(key_array)
+    key_array[order].tofile(directory / "keys.bin")
+    np.fromiter(keys.values(), dtype=np.int64, count=len(keys))[order].tofile(
+        directory / "key_order.bin"
+    )
+
+    with open(directory / "strings.pkl", "wb+") as f:
+        pickle.dump(strings, f)
+
+    with open(directory / "meta.json", "w+") as f:
+        json.dump({"num_docs": len(lengths), "num_tokens": int(offsets[-1])}, f)
+
+    return Property_Store(directory)
+
+
+class Property_Store:
+    """
+    A read-only, memory-mapped store of per-token properties,
+    as created by write_store.
+
+    The store can be pickled, e.g. in order to send property functions
+    reading from it to worker processes. Each process maps the files anew.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._open()
+
+    def _open(self) -> None:
+        with open(self.directory / "meta.json") as f:
+            meta = json.load(f)
+
+        self.num_docs: int = meta["num_docs"]
+        self.num_tokens: int = meta["num_tokens"]
+
+        self.offsets = self._map("offsets", np.int64, self.num_docs + 1)
+        self.keys = self._map("keys", np.uint64, self.num_docs)
+        self.key_order = self._map("key_order", np.int64, self.num_docs)
+        self.columns = {
+            column: self._map(column, dtype, self.num_tokens)
+            for column, dtype in COLUMNS.items()
+        }
+
+    def _map(self, name: str, dtype: type, size: int) -> np.ndarray:
+        # empty files cannot be memory-mapped
+        if size == 0:
+            return np.zeros(0, dtype=dtype)
+
+        return np.memmap(
+            self.directory / f"{name}.bin", dtype=dtype, mode="r", shape=(size,)
+        )
+
+    def __getstate__(self) -> dict:
+        return {"directory": self.directory}
+
+    def __setstate__(self, state: dict) -> None:
+        self.directory = state["directory"]
+        self._open()
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def index(self, doc: Document) -> Optional[int]:
+        """The position of the document in the store, if it is stored."""
+        key = np.uint64(_store_key(doc))
+        position = int(np.searchsorted(self.keys, key))
+        if position < self.num_docs and self.keys[position] == key:
+            return int(self.key_order[position])
+
+        return None
+
+    def __contains__(self, doc: object) -> bool:
+        return isinstance(doc, Document) and self.index(doc) is not None
+
+    def get_column(self, column: str, doc: Document) -> Optional[np.ndarray]:
+        """
+        The stored values of the column for each original token of the document.
+
+        The result is a read-only view onto the memory-mapped file.
+        Returns None if the document is not stored.
+        """
+        index = self.index(doc)
+        if index is None:
+            return None
+
+        return self.columns[column][self.offsets[index] : self.offsets[index + 1]]
+
+    @cached_property
+    def strings(self) -> dict[int, str]:
+        """The strings of all stored IDs. Only loaded on first use."""
+        with open(self.directory / "strings.pkl", "rb") as f:
+            return pickle.load(f)
+
+    def decode(self, ids: Iterable[int]) -> list[str]:
+        """Turn the stored IDs of tokens, lemmas or UPOS tags back into strings."""
+        return [self.strings[string_id] for string_id in ids]
+
+    def get_property_fun(
+        self, column: str, fallback: Optional[Array_Property_Function] = None
+    ) -> Array_Property_Function:
+        """
+        A property function that reads the column from the store.
+
+        For documents that are not stored, the fallback is used instead.
+        By default, this computes the column in the same way as write_store.
+        """
+        if column not in COLUMNS:
+            raise ValueError(
+                f"Unknown column {column!r}, expected one of {list(COLUMNS)}"
+            )
+
+        return partial(_read_column, self, column, fallback or _column_funs[column])
+
+    def get_sentencizer(self, column: str) -> Split_Function:
+        """A split function that splits the column into sentences."""
+        return partial(
+            _split_by_sentences,
+            self.get_property_fun(column),
+            self.get_property_fun("sent_start"),
+        )
+
+
+def _read_column(
+    store: Property_Store, column: str, fallback: Array_Property_Function, doc: Document
+) -> np.ndarray:
+    values = store.get_column(column, doc)
+    if values is None:
+        return fallback(doc)
+
+    return values
+
+
+def _split_by_sentences(
+    property_fun: Callable[[Document], np.ndarray],
+    sent_start_fun: Callable[[Document], np.ndarray],
+    doc: Document,
+) -> list[np.ndarray]:
+    values = np.asarray(property_fun(doc))
+    starts = np.flatnonzero(np.asarray(sent_start_fun(doc)))
+    return np.split(values, starts[1:])
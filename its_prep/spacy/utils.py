@@ -1,20 +1,36 @@
-from collections.abc import Callable, Iterator, Sequence
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from contextlib import contextmanager
 from enum import Enum
-from functools import lru_cache, reduce
+from functools import partial, reduce, wraps
+from itertools import tee
 from pathlib import Path
-from typing import Optional
-
-import de_core_news_lg
-from its_prep.types import Document, Property, Property_Function, Split_Function, Tokens
-from its_prep.utils import Spacy_defaultdict
+from typing import Any, Optional, cast, overload
+
+import numpy as np
+from its_prep.types import (
+    Array_Property_Function,
+    Document,
+    Interned_Tokens,
+    Property,
+    Property_Function,
+    Split_Function,
+    Tokens,
+    content_digest,
+)
+from its_prep.utils import (
+    Cache_Stats,
+    Keyed_defaultdict,
+    Sharded_Doc_Store,
+    Spacy_defaultdict,
+    estimate_doc_size,
+    estimate_property_size,
+)
 
+import spacy.attrs
+import spacy.strings
 import spacy.tokens
-from spacy.language import PipeCallable
-
-# spacy NLP pipelines / models
-nlp = de_core_news_lg.load()
-nlp_sentensizer = nlp.add_pipe("sentencizer")
+from spacy.language import Language, PipeCallable
+from spacy.pipeline import Sentencizer
 
 
 # optional pipelines
@@ -23,17 +39,429 @@ class opt_pipes(Enum):
     MERGE_NAMED_ENTITIES = "merge_entities"
 
 
-opt_pipe_funs: dict[opt_pipes, PipeCallable] = dict()
-for pipe in opt_pipes:
-    opt_pipe_funs[pipe] = nlp.add_pipe(pipe.value)
-    nlp.disable_pipe(pipe.value)
+# spacy NLP pipelines / models.
+# these are loaded on first use, because loading the model is expensive
+_nlp: Optional[Language] = None
+_nlp_sentensizer: Optional[Sentencizer] = None
+_opt_pipe_funs: dict[opt_pipes, PipeCallable] = dict()
+# whether the model was given through set_nlp, rather than loaded by default
+_nlp_is_custom = False
+
+
+def get_nlp() -> Language:
+    """Return the spaCy model, loading it if it has not been loaded yet."""
+    global _nlp_is_custom
+
+    if _nlp is None:
+        import de_core_news_lg
+
+        set_nlp(de_core_news_lg.load())
+        _nlp_is_custom = False
+
+    assert _nlp is not None
+    return _nlp
+
+
+def set_nlp(nlp: Language) -> None:
+    """
+    Use the given spaCy model instead of de_core_news_lg,
+    e.g. a smaller model or a blank one for testing.
+
+    The sentencizer and the optional pipes are added to the model.
+    Documents that were already analyzed with another model stay cached,
+    see clear_caches.
+    """
+    global _nlp, _nlp_sentensizer, _nlp_is_custom
 
-# caches that store already processed texts
-_text_cache_original: Spacy_defaultdict[str] = Spacy_defaultdict(nlp)
-_text_cache_current: Spacy_defaultdict[str] = Spacy_defaultdict(nlp)
-_tokens_cache: Spacy_defaultdict[Tokens] = Spacy_defaultdict(
-    lambda x: spacy.tokens.Doc(vocab=nlp.vocab, words=list(x))
+    if "sentencizer" in nlp.pipe_names:
+        _nlp_sentensizer = cast(Sentencizer, nlp.get_pipe("sentencizer"))
+    else:
+        _nlp_sentensizer = cast(Sentencizer, nlp.add_pipe("sentencizer"))
+
+    for pipe in opt_pipes:
+        if pipe.value not in nlp.component_names:
+            nlp.add_pipe(pipe.value)
+
+        _opt_pipe_funs[pipe] = nlp.get_pipe(pipe.value)
+        nlp.disable_pipe(pipe.value)
+
+    _nlp = nlp
+    _nlp_is_custom = True
+
+
+def get_sentensizer() -> Sentencizer:
+    """Return the sentencizer pipe of the spaCy model."""
+    get_nlp()
+    assert _nlp_sentensizer is not None
+    return _nlp_sentensizer
+
+
+def get_opt_pipe_fun(pipe: opt_pipes) -> PipeCallable:
+    """Return the (disabled) optional pipe of the spaCy model."""
+    get_nlp()
+    return _opt_pipe_funs[pipe]
+
+
+def __getattr__(name: str):
+    # backwards compatibility for the formerly eagerly loaded model
+    if name == "nlp":
+        return get_nlp()
+    if name == "nlp_sentensizer":
+        return get_sentensizer()
+    if name == "opt_pipe_funs":
+        get_nlp()
+        return _opt_pipe_funs
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def string_ids(strings: Iterable[str]) -> np.ndarray:
+    """
+    The spaCy IDs of the given strings, as used by array-valued properties.
+
+    For symbols like universal POS tags, these are the IDs of the symbols.
+    For any other strings, these are their hashes in spaCy's string store.
+    """
+    return np.fromiter(
+        (spacy.strings.get_string_id(string) for string in strings), dtype=np.uint64
+    )
+
+
+def vectors_of_ids(ids: np.ndarray) -> np.ndarray:
+    """
+    The word vectors of the strings with the given spaCy IDs, as a matrix.
+
+    The rows are gathered from the vector table of the spaCy model at once.
+    Strings without a vector are assigned zeros, as in spaCy itself.
+    """
+    vectors = get_nlp().vocab.vectors
+    ids = np.asarray(ids, dtype=np.uint64)
+
+    # floret vectors are computed from the strings, rather than looked up
+    if vectors.mode != "default":
+        vocab = get_nlp().vocab
+        return np.array(
+            [vocab.get_vector(string_id) for string_id in ids.tolist()],
+            dtype=np.float32,
+        ).reshape(len(ids), vectors.shape[1])
+
+    table = np.asarray(vectors.data)
+    if len(ids) == 0 or len(table) == 0:
+        return np.zeros((len(ids), vectors.shape[1]), dtype=table.dtype)
+
+    # look up each distinct ID only once
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    rows = np.asarray(vectors.find(keys=unique_ids.tolist()), dtype=np.int64)
+    unique_vectors = table[np.maximum(rows, 0)]
+    unique_vectors[rows < 0] = 0
+
+    return unique_vectors[inverse]
+
+
+# the spaCy components required for particular annotations
+# (in addition to the tokenizer). Components that the model lacks are ignored
+POS_COMPONENTS = ("tok2vec", "tagger", "morphologizer", "attribute_ruler")
+LEMMA_COMPONENTS = POS_COMPONENTS + ("lemmatizer",)
+PARSER_COMPONENTS = POS_COMPONENTS + ("parser",)
+NER_COMPONENTS = ("tok2vec", "ner")
+# the components whose sentence boundaries take precedence over the sentencizer
+SENTENCE_COMPONENTS = PARSER_COMPONENTS + ("senter",)
+# the components that set sentence boundaries without parsing the document
+SENTER_COMPONENTS = ("senter",)
+
+# the components to run when analyzing new texts. All of them, if None
+_enabled_components: Optional[frozenset[str]] = None
+
+# where processed documents record the components that were applied to them
+_COMPONENTS_KEY = "its_prep_components"
+
+
+def requires_components(*components: str) -> Callable:
+    """
+    Declare the spaCy components that the decorated function depends on.
+
+    See get_required_components and only_components.
+    """
+
+    def decorator(fun: Callable) -> Callable:
+        fun.spacy_components = frozenset(components)  # type: ignore[attr-defined]
+        return fun
+
+    return decorator
+
+
+def get_required_components(*funs: Callable) -> frozenset[str]:
+    """
+    Collect the spaCy components that the given functions depend on.
+
+    Filters and pipelines (partial applications of other functions)
+    are searched for the property functions they are based on.
+    """
+    components: set[str] = set()
+    to_visit = list(funs)
+    while to_visit:
+        fun = to_visit.pop()
+        components.update(getattr(fun, "spacy_components", ()))
+
+        if isinstance(fun, partial):
+            to_visit.append(fun.func)
+            to_visit.extend(
+                arg for arg in (*fun.args, *fun.keywords.values()) if callable(arg)
+            )
+
+    return frozenset(components)
+
+
+def set_enabled_components(components: Optional[Iterable[str]]) -> None:
+    """
+    Only run the given spaCy components when analyzing new texts,
+    e.g. those from get_required_components. Run all of them if None.
+
+    Components that are needed later on, e.g. by property functions that
+    declared them, are then run on demand on the affected documents only.
+    """
+    global _enabled_components
+    _enabled_components = frozenset(components) if components is not None else None
+
+
+@contextmanager
+def only_components(components: Iterable[str]) -> Iterator[None]:
+    """Like set_enabled_components, but only within the context."""
+    previous = _enabled_components
+    set_enabled_components(components)
+    try:
+        yield
+    finally:
+        set_enabled_components(previous)
+
+
+def _selected_pipes() -> list[str]:
+    """The names of the enabled pipes to analyze new texts with."""
+    pipe_names = get_nlp().pipe_names
+    if _enabled_components is None:
+        return pipe_names
+
+    # the sentencizer is cheap and does not depend on other components
+    return [
+        name
+        for name in pipe_names
+        if name in _enabled_components or name == "sentencizer"
+    ]
+
+
+@contextmanager
+def _analysis_pipes() -> Iterator[Language]:
+    """The spaCy model, with all components but the selected ones disabled."""
+    nlp = get_nlp()
+    if _enabled_components is None:
+        yield nlp
+        return
+
+    with nlp.select_pipes(enable=_selected_pipes()):
+        yield nlp
+
+
+def _record_components(processed_doc: spacy.tokens.Doc, pipes: list[str]) -> None:
+    # documents without a record were analyzed by all components
+    if _enabled_components is not None:
+        processed_doc.user_data[_COMPONENTS_KEY] = tuple(pipes)
+
+
+def _ensure_components(
+    processed_doc: spacy.tokens.Doc, components: Iterable[str]
+) -> spacy.tokens.Doc:
+    """
+    Run the given components on the processed document in place,
+    unless they were already applied during its analysis.
+    """
+    applied = processed_doc.user_data.get(_COMPONENTS_KEY)
+    if applied is None:
+        return processed_doc
+
+    components = set(components)
+    nlp = get_nlp()
+    missing = [
+        name for name in nlp.pipe_names if name in components and name not in applied
+    ]
+
+    # components that listen to an embedding component (e.g. the parser
+    # listening to tok2vec) read its output from the document's tensor,
+    # which DocBin does not persist. Thus, their embedding components are
+    # run again, before them
+    embedding_components = {
+        name
+        for name, pipe in nlp.pipeline
+        if set(getattr(pipe, "listening_components", ())) & set(missing)
+    }
+    to_run = [
+        name
+        for name in nlp.pipe_names
+        if name in missing or name in embedding_components
+    ]
+    for name in to_run:
+        processed_doc = nlp.get_pipe(name)(processed_doc)
+
+    newly_applied = tuple(name for name in to_run if name not in applied)
+    processed_doc.user_data[_COMPONENTS_KEY] = tuple(applied) + newly_applied
+    return processed_doc
+
+
+def _analyze_text(text: str) -> spacy.tokens.Doc:
+    with _analysis_pipes() as nlp:
+        processed_doc = nlp(text)
+        _record_components(processed_doc, nlp.pipe_names)
+
+    return processed_doc
+
+
+def _analyze_tokens(tokens: Tokens | Interned_Tokens) -> spacy.tokens.Doc:
+    return spacy.tokens.Doc(vocab=get_nlp().vocab, words=list(tokens))
+
+
+# bounds of each of the caches below; unbounded by default
+_cache_limits: dict[str, Optional[int]] = {"max_entries": None, "max_size": None}
+
+
+def _cache_kwargs() -> dict:
+    return {"size_fun": estimate_doc_size, **_cache_limits}
+
+
+def _tokens_digest(tokens: Tokens | Interned_Tokens) -> int:
+    return content_digest(*tokens)
+
+
+# caches that store already processed texts.
+# entries are stored under the content digests of their texts / tokens,
+# such that the caches do not keep the texts themselves alive
+_text_cache_original: Spacy_defaultdict[str] = Spacy_defaultdict(
+    _analyze_text, key_fun=content_digest, **_cache_kwargs()
 )
+_text_cache_current: Spacy_defaultdict[str] = Spacy_defaultdict(
+    _analyze_text, key_fun=content_digest, **_cache_kwargs()
+)
+_tokens_cache: Spacy_defaultdict[Tokens | Interned_Tokens] = Spacy_defaultdict(
+    _analyze_tokens, key_fun=_tokens_digest, **_cache_kwargs()
+)
+
+
+def set_cache_limits(
+    max_entries: Optional[int] = None, max_bytes: Optional[int] = None
+) -> None:
+    """
+    Bound the caches of processed spaCy documents.
+
+    Each cache is bounded separately. When a bound is exceeded,
+    the least recently used documents are evicted from the cache
+    and will be re-analyzed if they are needed again.
+
+    :param max_entries: The maximum number of documents per cache.
+                        Unbounded if not given.
+    :param max_bytes: The maximum estimated memory usage per cache, in bytes.
+                      Unbounded if not given.
+    """
+    _cache_limits["max_entries"] = max_entries
+    _cache_limits["max_size"] = max_bytes
+
+    for cache in (_text_cache_original, _text_cache_current, _tokens_cache):
+        cache.set_limits(**_cache_limits)
+
+
+# the on-disk stores shared between processes, by the cache they back,
+# and the arguments of use_shared_caches that created them
+_shared_stores: dict[str, Sharded_Doc_Store] = dict()
+_shared_stores_args: Optional[tuple[Path, int]] = None
+
+
+def _get_vocab() -> spacy.vocab.Vocab:
+    return get_nlp().vocab
+
+
+def _attach_shared_stores() -> None:
+    caches: dict[str, Spacy_defaultdict] = {
+        "text_original": _text_cache_original,
+        "text_current": _text_cache_current,
+        "tokens": _tokens_cache,
+    }
+    for name, cache in caches.items():
+        cache.set_backend(_shared_stores.get(name), vocab_fun=_get_vocab)
+
+
+def use_shared_caches(directory: Optional[Path], num_shards: int = 256) -> None:
+    """
+    Back the caches of processed spaCy documents by a sharded store on disk.
+
+    Documents that are missing from a cache are loaded from the store,
+    before analyzing them again. Newly analyzed documents are added to it,
+    as are the documents that were already cached, e.g. through load_caches.
+    Thus, processes on the same machine that use the same directory
+    share their analyses, e.g. the workers of apply_filters_parallel.
+    Because the caches are module-level state, each process must call this
+    function itself, e.g. at the start of its work.
+    The workers of apply_filters_parallel do so automatically,
+    see get_process_config.
+
+    :param directory: The directory of the shared store.
+                      If None, the caches are no longer backed by a store.
+    :param num_shards: The number of shards for a new store.
+    """
+    global _shared_stores_args
+
+    _shared_stores.clear()
+    _shared_stores_args = (directory, num_shards) if directory is not None else None
+    if directory is not None:
+        for name in ("text_original", "text_current", "tokens"):
+            _shared_stores[name] = Sharded_Doc_Store(
+                directory / name, num_shards=num_shards
+            )
+
+    _attach_shared_stores()
+
+
+def get_process_config(include_model: bool = True) -> dict[str, Any]:
+    """
+    The configuration of the analysis in this process, such that other
+    processes can analyze texts in the same way, see set_process_config.
+
+    It consists of the model given to set_nlp, the enabled components,
+    the limits of the caches and the shared caches.
+    The default model is not included, as each process can load it itself.
+
+    :param include_model: Whether to include the model given to set_nlp.
+                          Forked processes already share it.
+    """
+    return {
+        "nlp": _nlp if include_model and _nlp_is_custom else None,
+        "enabled_components": _enabled_components,
+        "cache_limits": dict(_cache_limits),
+        "shared_caches": _shared_stores_args,
+    }
+
+
+def set_process_config(config: dict[str, Any]) -> None:
+    """Analyze texts like the process that created the configuration."""
+    if config["nlp"] is not None:
+        set_nlp(config["nlp"])
+
+    set_enabled_components(config["enabled_components"])
+    set_cache_limits(
+        max_entries=config["cache_limits"]["max_entries"],
+        max_bytes=config["cache_limits"]["max_size"],
+    )
+    if config["shared_caches"] is not None:
+        use_shared_caches(*config["shared_caches"])
+
+
+def clear_caches() -> None:
+    """
+    Forget all processed documents and memoized properties of this process.
+
+    Documents in a shared store (see use_shared_caches) are kept.
+    """
+    for cache in (_text_cache_original, _text_cache_current, _tokens_cache):
+        cache.clear()
+
+    _property_cache.clear()
+    _sents_cache.clear()
 
 
 def save_caches(directory: Path, file_prefix: str = "") -> None:
@@ -63,18 +491,22 @@ def _load_text_cache(directory: Path, file_prefix: str = "") -> None:
     keys_path = directory / f"{file_prefix}text_to_doc_cache_keys"
     docs_path = directory / f"{file_prefix}text_to_doc_cache_docs"
 
-    global _text_cache_original
+    global _text_cache_original, _text_cache_current
     _text_cache_original = Spacy_defaultdict.from_file(
-        default_factory=nlp,
+        default_factory=_analyze_text,
         keys_path=keys_path,
         docs_path=docs_path,
-        vocab=nlp.vocab,
+        vocab=get_nlp().vocab,
+        key_fun=content_digest,
+        **_cache_kwargs(),
     )
     _text_cache_current = Spacy_defaultdict.from_file(
-        default_factory=nlp,
+        default_factory=_analyze_text,
         keys_path=keys_path.with_name(f"{file_prefix}text_to_doc_cache_keys_current"),
         docs_path=docs_path.with_name(f"{file_prefix}text_to_doc_cache_docs_current"),
-        vocab=nlp.vocab,
+        vocab=get_nlp().vocab,
+        key_fun=content_digest,
+        **_cache_kwargs(),
     )
 
 
@@ -84,12 +516,13 @@ def _load_tokens_cache(directory: Path, file_prefix: str = "") -> None:
     docs_path = directory / f"{file_prefix}tokens_to_doc_cache_docs"
 
     global _tokens_cache
-    default_factory = lambda x: spacy.tokens.Doc(vocab=nlp.vocab, words=list(x))
     _tokens_cache = Spacy_defaultdict.from_file(
-        default_factory=default_factory,
+        default_factory=_analyze_tokens,
         keys_path=keys_path,
         docs_path=docs_path,
-        vocab=nlp.vocab,
+        vocab=get_nlp().vocab,
+        key_fun=_tokens_digest,
+        **_cache_kwargs(),
     )
 
 
@@ -103,10 +536,66 @@ def load_caches(directory: Path, file_prefix: str = "") -> None:
 
     _load_text_cache(directory, file_prefix)
     _load_tokens_cache(directory, file_prefix)
+    _attach_shared_stores()
+
+
+def _original_doc(text: str, digest: int) -> spacy.tokens.Doc:
+    return _text_cache_original.lookup(text, digest)
+
+
+def _current_doc(text: str, digest: int) -> spacy.tokens.Doc:
+    if _text_cache_current.contains_stored(digest):
+        return _text_cache_current.lookup(text, digest)
+
+    return _original_doc(text, digest)
 
 
 def original_spacy_doc_from_text(text: str) -> spacy.tokens.Doc:
-    return _text_cache_original[text]
+    return _original_doc(text, content_digest(text))
+
+
+def pipe_texts(
+    texts: Iterable[str], batch_size: int = 256, n_process: int = 1
+) -> Iterator[str]:
+    """
+    Analyze the given texts in batches, storing the results in the cache.
+
+    Only texts that have not been analyzed yet are sent through nlp.pipe.
+    The texts are yielded lazily and in their original order,
+    as soon as their analyzed version is available in the cache.
+
+    :param batch_size: The number of texts to analyze at once.
+    :param n_process: The number of processes to use for the analysis.
+    """
+    # the digest of each text is only computed once
+    texts_and_digests, to_analyze = tee((text, content_digest(text)) for text in texts)
+    pipes = _selected_pipes()
+    analyzed = get_nlp().pipe(
+        (
+            (text, digest)
+            for text, digest in to_analyze
+            if not _text_cache_original.contains_stored(digest)
+        ),
+        as_tuples=True,
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=[name for name in get_nlp().pipe_names if name not in pipes],
+    )
+
+    for text, digest in texts_and_digests:
+        # consume analyzed documents until the current text is available.
+        # because duplicates may be analyzed more than once,
+        # this may also store documents of texts that were already seen
+        while not _text_cache_original.contains_stored(digest):
+            try:
+                processed_doc, analyzed_digest = next(analyzed)
+            except StopIteration:
+                # should never happen, but the cache will analyze on demand
+                break
+            _record_components(processed_doc, pipes)
+            _text_cache_original.update_stored({analyzed_digest: processed_doc})
+
+        yield text
 
 
 def current_spacy_doc_from_text(text: str) -> spacy.tokens.Doc:
@@ -118,13 +607,10 @@ def current_spacy_doc_from_text(text: str) -> spacy.tokens.Doc:
     The primary way in which a spacy document may change is through merging
     of tokens (e.g. named entities).
     """
-    if text in _text_cache_current:
-        return _text_cache_current[text]
-
-    return original_spacy_doc_from_text(text)
+    return _current_doc(text, content_digest(text))
 
 
-def spacy_doc_from_tokens(tokens: Tokens) -> spacy.tokens.Doc:
+def spacy_doc_from_tokens(tokens: Tokens | Interned_Tokens) -> spacy.tokens.Doc:
     """
     Helper function to turn tokens into processed spaCy docs,
     without re-tokenizing them.
@@ -141,33 +627,130 @@ def get_tokenizer_with(
         [opt_pipes.MERGE_NOUN_CHUNKS] if merge_noun_chunks else []
     )
 
+    components = set(LEMMA_COMPONENTS if prop.startswith("lemma") else ())
+    if merge_named_entities:
+        components.update(NER_COMPONENTS)
+    if merge_noun_chunks:
+        components.update(PARSER_COMPONENTS)
+
     def fun(text: str) -> Tokens:
-        # we need to copy the document,
-        # as applying a pipeline function to a document modifies it in place
-        doc = original_spacy_doc_from_text(text).copy()
-        pipes = [opt_pipe_funs[pipe] for pipe in sel_pipes]
-        doc = reduce(lambda x, fun: fun(x), pipes, doc)
-        _text_cache_current[text] = doc
+        digest = content_digest(text)
+        original_doc = _ensure_components(_original_doc(text, digest), components)
+        # remember how the current version was created, such that it can be
+        # rebuilt if it is evicted from the cache
+        original_doc.user_data[_MERGED_PIPES_KEY] = [pipe.value for pipe in sel_pipes]
+        doc = _merge_doc(original_doc, sel_pipes)
+        _text_cache_current.update_stored({digest: doc})
         return Tokens(getattr(token, prop) for token in doc)
 
     return fun
 
 
-def document_into_spacy_doc(doc: Document) -> spacy.tokens.Doc:
-    """Transform a document into its analyzed spaCy counterpart."""
+# where original documents record the optional pipes
+# that were applied to their current version
+_MERGED_PIPES_KEY = "its_prep_merged_pipes"
+
 
+def _merge_doc(
+    original_doc: spacy.tokens.Doc, pipes: Iterable[opt_pipes]
+) -> spacy.tokens.Doc:
+    # we need to copy the document,
+    # as applying a pipeline function to a document modifies it in place
+    pipe_funs = [get_opt_pipe_fun(pipe) for pipe in pipes]
+    return reduce(lambda x, fun: fun(x), pipe_funs, original_doc.copy())
+
+
+def _spacy_doc_from_contents(
+    text: str, digest: int, tokens: Tokens | Interned_Tokens
+) -> spacy.tokens.Doc:
     # if the document was tokenized by spacy, it was stored during this step
-    text = doc.original_text
-    if text in _text_cache_current or text in _text_cache_original:
-        return current_spacy_doc_from_text(doc.original_text)
+    caches = (_text_cache_current, _text_cache_original)
+    if any(cache.contains_stored(digest) for cache in caches):
+        processed_doc = _current_doc(text, digest)
+        if len(processed_doc) == len(tokens):
+            return processed_doc
+
+        # with bounded caches, the version matching the document's tokens
+        # may have been evicted. Then, it is rebuilt from the original version
+        original_doc = _original_doc(text, digest)
+        if len(original_doc) == len(tokens):
+            return original_doc
+
+        merged_pipes = original_doc.user_data.get(_MERGED_PIPES_KEY)
+        if merged_pipes:
+            processed_doc = _merge_doc(original_doc, map(opt_pipes, merged_pipes))
+            if len(processed_doc) == len(tokens):
+                _text_cache_current.update_stored({digest: processed_doc})
+                return processed_doc
 
     # otherwise, return an analyzed version that was not tokenized again
-    return spacy_doc_from_tokens(doc.original_tokens)
+    return spacy_doc_from_tokens(tokens)
+
+
+def document_into_spacy_doc(doc: Document) -> spacy.tokens.Doc:
+    """Transform a document into its analyzed spaCy counterpart."""
+    # the digest of the text is kept by the document,
+    # such that the text is not hashed on each access of the caches
+    return _spacy_doc_from_contents(
+        doc.original_text, doc.text_digest, doc.original_tokens
+    )
 
 
+def _compute_property(
+    key: tuple[Callable[[spacy.tokens.Doc], Sequence[Property] | np.ndarray], Document]
+) -> Sequence[Property] | np.ndarray:
+    fun, doc = key
+    processed_doc = document_into_spacy_doc(doc)
+    components = getattr(fun, "spacy_components", ())
+    return fun(_ensure_components(processed_doc, components))
+
+
+def _property_key(
+    key: tuple[Callable[[spacy.tokens.Doc], Sequence[Property]], Document]
+) -> tuple[Callable, int]:
+    fun, doc = key
+    return fun, doc.digest
+
+
+# results of property functions, by function and document contents,
+# such that each property is only computed once per document
+_property_cache: Keyed_defaultdict[tuple, Sequence | np.ndarray] = Keyed_defaultdict(
+    _compute_property,
+    max_entries=2**16,
+    key_fun=_property_key,
+    size_fun=estimate_property_size,
+)
+
+
+def set_property_cache_limit(max_entries: Optional[int] = 2**16) -> None:
+    """
+    Change the number of memoized property function results.
+
+    :param max_entries: The maximum number of results to keep,
+                        where each result belongs to one property function
+                        and one document. Unbounded if None.
+                        Set to zero to disable the memoization.
+    """
+    _property_cache.set_limits(max_entries=max_entries)
+
+
+@overload
+def property_from_doc(
+    fun: Callable[[spacy.tokens.Doc], np.ndarray]
+) -> Array_Property_Function:
+    ...
+
+
+@overload
 def property_from_doc(
     fun: Callable[[spacy.tokens.Doc], Sequence[Property]]
 ) -> Property_Function[Property]:
+    ...
+
+
+def property_from_doc(
+    fun: Callable[[spacy.tokens.Doc], Sequence[Property] | np.ndarray]
+) -> Property_Function[Property] | Array_Property_Function:
     """
     Transform functions that act on processed spaCy documents
     to functions that act on our document representation.
@@ -178,19 +761,154 @@ def property_from_doc(
 
     We store a mapping between the original text and the processed document,
     such that each sub-document does not need to be processed again.
+    Additionally, the result is memoized for each document, so
+    repeated calls on (sub-documents of) the same document are cheap.
+    Thus, the returned sequences are shared and must not be modified.
+
+    The returned function keeps the name of the decorated function,
+    so property functions defined at module level can be pickled.
+    It also keeps the spaCy components declared through requires_components,
+    which are run on demand if they were disabled during the analysis.
     """
 
-    def wrapped_fun(doc: Document) -> Sequence[Property]:
-        processed_doc = document_into_spacy_doc(doc)
-        return fun(processed_doc)
+    @wraps(fun)
+    def wrapped_fun(doc: Document) -> Sequence[Property] | np.ndarray:
+        return _property_cache[(fun, doc)]
+
+    return cast(Property_Function[Property] | Array_Property_Function, wrapped_fun)
+
+
+def _sentence_components() -> tuple[str, ...]:
+    """
+    The components whose sentence boundaries are used.
+
+    The parser is only used if it is enabled for the analysis anyway,
+    see set_enabled_components. Otherwise, the sentence boundaries
+    do not require parsing the documents.
+    """
+    if _enabled_components is None or "parser" in _enabled_components:
+        return SENTENCE_COMPONENTS
+
+    return SENTER_COMPONENTS
+
+
+def _was_applied(processed_doc: spacy.tokens.Doc, name: str) -> bool:
+    applied = processed_doc.user_data.get(_COMPONENTS_KEY)
+    if applied is None:
+        return name in get_nlp().pipe_names
+
+    return name in applied
+
+
+def _compute_sentence_offsets(doc: Document) -> np.ndarray:
+    # the components that set sentence boundaries are run first, such that
+    # the offsets do not depend on whether they were run on the document yet
+    components = _sentence_components()
+    processed_doc = _ensure_components(document_into_spacy_doc(doc), components)
+    num_tokens = len(processed_doc)
+
+    # keep any existing boundaries, e.g. those set by the parser,
+    # and predict the missing ones, without modifying the cached document.
+    # if the parser is not used, the boundaries of a parser that was run
+    # on demand (e.g. for noun chunks) are ignored for the same reason
+    if "parser" in components or not _was_applied(processed_doc, "parser"):
+        existing = processed_doc.to_array(spacy.attrs.SENT_START)
+    else:
+        existing = np.zeros(num_tokens, dtype=np.int32)
+    predicted = get_sentensizer().predict([processed_doc])[0]
+    sent_starts = np.where(
+        existing == 0, np.asarray(predicted, dtype=bool), existing == 1
+    )
+    sent_starts[:1] = True
+
+    return np.append(np.flatnonzero(sent_starts), num_tokens).astype(np.int64)
+
+
+def _sentence_key(doc: Document) -> int:
+    return doc.digest
+
+
+# the boundaries of the sentences of each document, by its contents
+_sents_cache: Keyed_defaultdict[Document, np.ndarray] = Keyed_defaultdict(
+    _compute_sentence_offsets,
+    max_entries=2**16,
+    key_fun=_sentence_key,
+    size_fun=estimate_property_size,
+)
+
+
+def get_sentence_offsets(doc: Document) -> np.ndarray:
+    """
+    The boundaries of the sentences of the document.
+
+    The i-th sentence consists of the tokens with indices in
+    offsets[i]:offsets[i + 1]. The result is memoized for each document,
+    so it is shared and must not be modified.
+
+    The boundaries set by the SENTENCE_COMPONENTS are kept,
+    and the sentencizer predicts the remaining ones.
+    If the parser is not enabled for the analysis (see only_components),
+    only the SENTER_COMPONENTS are used, such that the documents are not
+    parsed for their sentences.
+    """
+    return _sents_cache[doc]
+
+
+def split_by_sentences(
+    property_fun: Property_Function[Property], doc: Document
+) -> list[Sequence[Property]]:
+    """Split the properties of the document's tokens by its sentences."""
+    values = property_fun(doc)
+    offsets = get_sentence_offsets(doc).tolist()
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def splits_at(offsets_fun: Callable[[Document], np.ndarray]) -> Callable:
+    """
+    Declare that the decorated split function splits each document at the
+    offsets returned by the given function, see get_sentence_offsets.
+
+    This allows for computing the lengths of the splits without
+    splitting the document, e.g. in get_filter_by_subset_len.
+    """
+
+    def decorator(fun: Callable) -> Callable:
+        fun.split_offsets = offsets_fun  # type: ignore[attr-defined]
+        return fun
+
+    return decorator
 
-    return wrapped_fun
 
+def get_cache_stats() -> dict[str, Cache_Stats]:
+    """
+    The usage statistics of each cache of this process,
+    since their counters were last reset.
+
+    The sizes of the caches are estimated in bytes.
+    """
+    return {
+        "text_original": _text_cache_original.stats,
+        "text_current": _text_cache_current.stats,
+        "tokens": _tokens_cache.stats,
+        "properties": _property_cache.stats,
+        "sentences": _sents_cache.stats,
+    }
 
-@lru_cache(maxsize=2**16)
-def _analyze_sents(processed_doc: spacy.tokens.Doc) -> spacy.tokens.Doc:
-    """Helper function to sentencize an already processed document"""
-    return nlp_sentensizer(processed_doc)
+
+def reset_cache_stats() -> None:
+    """Reset the counters of hits, misses and evictions of all caches."""
+    for cache in (
+        _text_cache_original,
+        _text_cache_current,
+        _tokens_cache,
+        _property_cache,
+        _sents_cache,
+    ):
+        cache.reset_stats()
+
+
+# marks processed documents that have been run through the sentencizer
+_SENTENCIZED_KEY = "its_prep_sentencized"
 
 
 def sentencizer_from_doc(
@@ -202,10 +920,24 @@ def sentencizer_from_doc(
     Because the default processing pipeline does not necessarily include
     a sentencizer, run the processed document through one
     before passing it onto the given function.
+    This is only done once per processed document.
+
+    For sentencizers that split the values of a property function,
+    split_by_sentences avoids working with the sentences of the spaCy document.
+    Unlike get_sentence_offsets, the sentences of the spaCy document follow
+    the parser whenever it was run on the document, e.g. on demand.
     """
 
+    @wraps(fun)
     def wrapped_fun(doc: Document) -> Sequence[Sequence[Property]]:
         processed_doc = document_into_spacy_doc(doc)
-        return fun(_analyze_sents(processed_doc))
+        # the same boundaries as in get_sentence_offsets
+        components = {*getattr(fun, "spacy_components", ()), *_sentence_components()}
+        processed_doc = _ensure_components(processed_doc, components)
+        if not processed_doc.user_data.get(_SENTENCIZED_KEY, False):
+            processed_doc = get_sentensizer()(processed_doc)
+            processed_doc.user_data[_SENTENCIZED_KEY] = True
+
+        return fun(processed_doc)
 
     return wrapped_fun
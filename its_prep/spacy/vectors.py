@@ -0,0 +1,103 @@
+"""
+Word vectors and document embeddings of entire corpora.
+
+The vectors of all selected tokens are gathered from the vector table
+of the spaCy model at once, rather than token by token.
+By default, tokens are identified by their text, such that the documents
+do not need to be analyzed by spaCy in order to look up their vectors.
+"""
+from collections.abc import Collection, Iterable
+from typing import Literal
+
+import its_prep.spacy.utils as utils
+import numpy as np
+from its_prep.core import flat_selected_properties
+from its_prep.types import Array_Property_Function, Document
+
+
+def token_ids(doc: Document) -> np.ndarray:
+    """The spaCy IDs of the texts of the document's tokens."""
+    return utils.string_ids(doc.original_tokens)
+
+
+def selected_word_vectors(
+    docs: Iterable[Document], id_fun: Array_Property_Function = token_ids
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The word vectors of all selected tokens, as a single matrix.
+
+    The vectors of the i-th document are given by
+    vectors[offsets[i] : offsets[i + 1]].
+
+    :param id_fun: The spaCy IDs of the strings to look up the vectors of,
+                   e.g. its_prep.spacy.props.lemmatize_ids for lemmas.
+    :return: The matrix of vectors and the offsets of each document,
+             with one more offset than there are documents.
+    """
+    ids, offsets = flat_selected_properties(docs, id_fun, dtype=np.uint64)
+    return utils.vectors_of_ids(ids), offsets
+
+
+def _inverse_document_frequencies(
+    term_ids: np.ndarray, offsets: np.ndarray, num_terms: int
+) -> np.ndarray:
+    """The smoothed IDF of each term, given the terms of each document."""
+    num_docs = len(offsets) - 1
+    doc_ids = np.repeat(np.arange(num_docs, dtype=np.int64), np.diff(offsets))
+
+    # count each term at most once per document
+    occurrences = np.unique(doc_ids * num_terms + term_ids)
+    document_freqs = np.bincount(occurrences % num_terms, minlength=num_terms)
+
+    return np.log((1 + num_docs) / (1 + document_freqs)) + 1
+
+
+def document_embeddings(
+    docs: Collection[Document],
+    weighting: Literal["mean", "tfidf"] = "mean",
+    id_fun: Array_Property_Function = token_ids,
+) -> np.ndarray:
+    """
+    Pool the word vectors of the selected tokens into one vector per document.
+
+    Documents without selected tokens are assigned zeros.
+
+    :param weighting: How to weight the vectors of the tokens.
+                      With "mean", all tokens are weighted equally.
+                      With "tfidf", each token is weighted by the
+                      inverse document frequency of its string within the
+                      given documents, such that each distinct string is
+                      weighted by its TF-IDF.
+    :param id_fun: The spaCy IDs of the strings to look up the vectors of.
+                   See selected_word_vectors.
+    :return: A matrix with one row per document.
+    """
+    if weighting not in ("mean", "tfidf"):
+        raise ValueError(f"Unknown weighting {weighting!r}, expected 'mean' or 'tfidf'")
+
+    ids, offsets = flat_selected_properties(docs, id_fun, dtype=np.uint64)
+
+    # only gather the vector of each distinct string once
+    unique_ids, term_ids = np.unique(ids, return_inverse=True)
+    term_vectors = utils.vectors_of_ids(unique_ids)
+
+    if weighting == "tfidf":
+        idf = _inverse_document_frequencies(term_ids, offsets, len(unique_ids))
+        weights = idf[term_ids]
+    else:
+        weights = np.ones(len(ids), dtype=term_vectors.dtype)
+
+    embeddings = np.zeros((len(offsets) - 1, term_vectors.shape[1]), np.float32)
+
+    # sum the weighted vectors of all documents at once;
+    # reduceat requires each document to contain at least one token
+    non_empty = np.diff(offsets) > 0
+    if non_empty.any():
+        starts = offsets[:-1][non_empty]
+        weighted_sums = np.add.reduceat(
+            weights[:, np.newaxis] * term_vectors[term_ids], starts
+        )
+        total_weights = np.add.reduceat(weights, starts)
+        embeddings[non_empty] = weighted_sums / total_weights[:, np.newaxis]
+
+    return embeddings
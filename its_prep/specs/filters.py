@@ -7,23 +7,64 @@ they are not defined directly, but created factory functions instead.
 
 These can be used as-is inside of pipeline definitions,
 or as guidance for defining further filtering functions.
+
+The created filters are partial applications of module-level functions,
+rather than local functions. Thus, they can be pickled (e.g. in order to
+send them to worker processes), as long as their arguments can be pickled.
 """
 from collections import defaultdict, Counter
-from collections.abc import Collection
-from typing import Optional, Set, TypeVar
+from collections.abc import Collection, Iterable, Mapping, Sequence
+from functools import partial
+from typing import Generic, Optional, Set, TypeVar
 
 import numpy as np
-from its_prep.types import Document, Filter, Property_Function, Split_Function
+from its_prep.types import (
+    Array_Property_Function,
+    Document,
+    Filter,
+    Mask_Function,
+    Property_Function,
+    Selection,
+    Split_Function,
+)
+
+
+def filter_from_mask(mask_fun: Mask_Function) -> Filter:
+    """
+    Turn a function that computes a token mask into a filter.
+
+    The mask function is kept as the mask attribute of the returned filter.
+    This allows multiple such filters to be evaluated as a single mask
+    computation, see its_prep.core.compile_pipeline.
+    """
+    filter_fun = partial(_filter_by_mask, mask_fun)
+    filter_fun.mask = mask_fun  # type: ignore[attr-defined]
+    return filter_fun
+
+
+def _filter_by_mask(mask_fun: Mask_Function, doc: Document) -> Document:
+    return doc.sub_doc(Selection.from_mask(mask_fun(doc)))
 
 
 def negated(fun: Filter) -> Filter:
     """Return a new filter function that returns the negated original result"""
+    mask_fun: Optional[Mask_Function] = getattr(fun, "mask", None)
+
+    # because masks do not depend on the current selection,
+    # the negation is simply the inverted mask
+    if mask_fun is not None:
+        return filter_from_mask(partial(_negated_mask, mask_fun))
 
-    def negated_fun(doc: Document) -> Document:
-        doc_filtered = fun(doc)
-        return doc.sub_doc(doc.selected - doc_filtered.selected)
+    return partial(_negated_filter, fun)
 
-    return negated_fun
+
+def _negated_mask(mask_fun: Mask_Function, doc: Document) -> np.ndarray:
+    return ~mask_fun(doc)
+
+
+def _negated_filter(fun: Filter, doc: Document) -> Document:
+    doc_filtered = fun(doc)
+    return doc.sub_doc(doc.selected - doc_filtered.selected)
 
 
 Property = TypeVar("Property")
@@ -38,49 +79,230 @@ def get_filter_by_property(
 
     Examples: filter based universal POS tags,
               a particular (un)wanted vocabulary of lemmatized tokens, etc.
+
+    If the property function returns integer arrays
+    (e.g. the ID-valued functions in its_prep.spacy.props),
+    the required properties should be given as the corresponding IDs.
+    In this case, the filter is computed in vectorized form.
+    Required strings are turned into their spaCy IDs for such functions,
+    see its_prep.spacy.utils.string_ids.
     """
+    req_ids: Optional[np.ndarray] = None
+    if all(
+        isinstance(prop, (int, np.integer)) and prop >= 0 for prop in req_properties
+    ):
+        req_ids = np.fromiter(req_properties, dtype=np.uint64)
+
+    return filter_from_mask(
+        partial(_property_mask, property_fun, req_properties, req_ids)
+    )
+
 
-    def filter_fun(doc: Document) -> Document:
-        return doc.sub_doc(
-            {
-                index
-                for index, prop in enumerate(property_fun(doc))
-                if prop in req_properties
-            }
+def _property_mask(
+    property_fun: Property_Function[Property],
+    req_properties: Collection[Property],
+    req_ids: Optional[np.ndarray],
+    doc: Document,
+) -> np.ndarray:
+    props = property_fun(doc)
+
+    if isinstance(props, np.ndarray) and np.issubdtype(props.dtype, np.unsignedinteger):
+        if req_ids is None:
+            req_ids = _string_ids(req_properties)
+
+        return np.isin(props, req_ids)
+
+    return np.fromiter((prop in req_properties for prop in props), dtype=bool)
+
+
+def _string_ids(req_properties: Collection) -> np.ndarray:
+    """The spaCy IDs of the required properties, which must be strings."""
+    if not all(isinstance(prop, str) for prop in req_properties):
+        raise TypeError(
+            "The property function returns IDs, "
+            "so the required properties must be IDs or strings"
         )
 
-    return filter_fun
+    import its_prep.spacy.utils as spacy_utils
 
+    return spacy_utils.string_ids(req_properties)
 
-def get_filter_by_bool_fun(bool_fun: Property_Function[bool]) -> Filter:
+
+def get_filter_by_bool_fun(
+    bool_fun: Property_Function[bool] | Array_Property_Function,
+) -> Filter:
     """
     Return a filter that returns the tokens that are considered True.
 
     Example: filter for stop words.
     """
+    return filter_from_mask(partial(_bool_mask, bool_fun))
 
-    def filter_fun(doc: Document) -> Document:
-        return doc.sub_doc(
-            {index for index, is_true in enumerate(bool_fun(doc)) if is_true}
-        )
 
-    return filter_fun
+def _bool_mask(
+    bool_fun: Property_Function[bool] | Array_Property_Function, doc: Document
+) -> np.ndarray:
+    values = bool_fun(doc)
+    if isinstance(values, np.ndarray):
+        return values.astype(bool, copy=False)
+
+    return np.fromiter(values, dtype=bool)
 
 
 def __in_interval(
-    x: float, lower: Optional[float], upper: Optional[float], interval_open: bool
-) -> bool:
+    x: float | np.ndarray,
+    lower: Optional[float],
+    upper: Optional[float],
+    interval_open: bool,
+) -> bool | np.ndarray:
+    """Check whether x lies inside the interval. Also works element-wise."""
     lower = lower if lower is not None else -np.inf
     upper = upper if upper is not None else np.inf
 
     if interval_open:
-        return lower < x < upper
+        return (lower < x) & (x < upper)
+
+    return (lower <= x) & (x <= upper)
 
-    return lower <= x <= upper
+
+def _encode_props(props: Sequence[Property], vocab: dict[Property, int]) -> np.ndarray:
+    """
+    Turn the properties into an integer array.
+
+    Integer arrays (e.g. hashes of strings) are used as-is.
+    Any other properties are mapped to IDs from the given vocabulary,
+    which is extended by unknown properties.
+    """
+    if isinstance(props, np.ndarray) and np.issubdtype(props.dtype, np.integer):
+        return props
+
+    return np.fromiter(
+        (vocab.setdefault(prop, len(vocab)) for prop in props),
+        dtype=np.int64,
+        count=len(props),
+    )
+
+
+def _count_document_frequencies_encoded(
+    docs: Iterable[Document],
+    property_fun: Property_Function[Property],
+    count_only_selected: bool = False,
+    batch_size: int = 4096,
+) -> tuple[list[Property], np.ndarray, int]:
+    """
+    Vectorized implementation of count_document_frequencies.
+
+    :return: The counted properties, their document frequencies
+             and the total number of documents.
+    """
+    vocab: dict[Property, int] = dict()
+    keys: Optional[np.ndarray] = None
+    counts = np.zeros(0, dtype=np.int64)
+    num_docs = 0
+    batch: list[np.ndarray] = []
+
+    def add_batch() -> tuple[np.ndarray, np.ndarray]:
+        batch_keys, batch_counts = np.unique(np.concatenate(batch), return_counts=True)
+        if keys is None:
+            return batch_keys, batch_counts
+
+        # merge the counts of the batch into the total counts
+        all_keys, inverse = np.unique(
+            np.concatenate([keys, batch_keys]), return_inverse=True
+        )
+        all_counts = np.bincount(
+            inverse,
+            weights=np.concatenate([counts, batch_counts]),
+            minlength=len(all_keys),
+        )
+        return all_keys, all_counts.astype(np.int64)
+
+    for doc in docs:
+        ids = _encode_props(property_fun(doc), vocab)
+        if count_only_selected:
+            indices = doc.selected.indices
+            ids = ids[indices[indices < len(ids)]]
+
+        # each property is only counted once per document
+        batch.append(np.unique(ids))
+        num_docs += 1
+
+        if len(batch) >= batch_size:
+            keys, counts = add_batch()
+            batch = []
+
+    if batch:
+        keys, counts = add_batch()
+
+    if keys is None:
+        return [], counts, num_docs
+
+    if vocab:
+        props_by_id = list(vocab.keys())
+        props = [props_by_id[key] for key in keys.tolist()]
+    else:
+        props = keys.tolist()
+
+    return props, counts, num_docs
+
+
+def count_document_frequencies(
+    docs: Iterable[Document],
+    property_fun: Property_Function[Property],
+    count_only_selected: bool = False,
+) -> tuple[Counter[Property], int]:
+    """
+    Count the number of documents each property occurs in.
+
+    The documents are only iterated over once, so they may also be streamed.
+    Internally, the properties are mapped to integer IDs,
+    such that they can be de-duplicated and counted in vectorized form.
+
+    :param count_only_selected: Only consider the properties
+                                of each document's selected tokens.
+    :return: The document frequency of each property
+             and the total number of documents.
+    """
+    props, counts, num_docs = _count_document_frequencies_encoded(
+        docs, property_fun, count_only_selected=count_only_selected
+    )
+    return Counter(dict(zip(props, counts.tolist()))), num_docs
+
+
+def select_props_by_document_frequency(
+    document_freqs: Mapping[Property, int],
+    num_docs: int,
+    min_num: Optional[int | float] = None,
+    max_num: Optional[int | float] = None,
+    min_rate: Optional[float] = None,
+    max_rate: Optional[float] = None,
+    interval_open: bool = False,
+) -> Set[Property]:
+    """
+    Return the properties with a document frequency within the given interval.
+
+    See get_props_by_document_frequency for more details.
+
+    :param document_freqs: The document frequencies of the properties,
+                           e.g. from count_document_frequencies.
+    :param num_docs: The total number of documents.
+    """
+    # override the interval boundaries according to the given rates
+    if min_rate is not None:
+        min_num = num_docs * min_rate
+
+    if max_rate is not None:
+        max_num = num_docs * max_rate
+
+    return {
+        prop
+        for prop, count in document_freqs.items()
+        if __in_interval(count, min_num, max_num, interval_open)
+    }
 
 
 def get_props_by_document_frequency(
-    docs: Collection[Document],
+    docs: Iterable[Document],
     property_fun: Property_Function[Property],
     min_num: Optional[int | float] = None,
     max_num: Optional[int | float] = None,
@@ -103,41 +325,24 @@ def get_props_by_document_frequency(
                      Overrides max_num if given.
     :param interval_open: Consider the interval to be open,
                           i.e. do not include words exactly at the boundaries.
+    :param count_only_selected: Only count the properties of selected tokens.
     """
-    # override the interval boundaries according to the given rates
-    if min_rate is not None:
-        min_num = len(docs) * min_rate
-
-    if max_rate is not None:
-        max_num = len(docs) * max_rate
-
-    # helper function to compute document frequencies
-    def get_document_freqs() -> Counter[Property]:
-        docs_as_sets = [
-            {
-                prop
-                for index, prop in enumerate(property_fun(doc))
-                # skip if only counting selected and index is not selected
-                if not count_only_selected or index in doc.selected
-            }
-            for doc in docs
-        ]
-
-        document_freqs: Counter[Property] = Counter()
-        [document_freqs.update(doc) for doc in docs_as_sets]
-
-        return document_freqs
-
-    dfs = get_document_freqs()
-    return {
-        prop
-        for prop, count in dfs.items()
-        if __in_interval(count, min_num, max_num, interval_open)
-    }
+    document_freqs, num_docs = count_document_frequencies(
+        docs, property_fun, count_only_selected=count_only_selected
+    )
+    return select_props_by_document_frequency(
+        document_freqs,
+        num_docs,
+        min_num=min_num,
+        max_num=max_num,
+        min_rate=min_rate,
+        max_rate=max_rate,
+        interval_open=interval_open,
+    )
 
 
 def get_filter_by_frequency(
-    docs: Collection[Document],
+    docs: Iterable[Document],
     property_fun: Property_Function[Property],
     min_num: Optional[int] = None,
     max_num: Optional[int] = None,
@@ -171,6 +376,128 @@ def get_filter_by_frequency(
     )
 
 
+class Document_Frequency_Index(Generic[Property]):
+    """
+    The document frequencies of a property, kept up to date
+    as documents are added to or removed from the corpus.
+
+    This allows for creating frequency filters for a growing corpus,
+    without counting the properties of all documents again.
+    Like the filters, the index can be pickled, as long as the
+    property function can be pickled.
+
+    :param property_fun: The function to use to analyze the documents,
+                         obtaining the property to base the count on.
+    :param count_only_selected: Only count the properties of selected tokens.
+    """
+
+    def __init__(
+        self,
+        property_fun: Property_Function[Property],
+        count_only_selected: bool = False,
+    ):
+        self.property_fun = property_fun
+        self.count_only_selected = count_only_selected
+        self.document_freqs: Counter[Property] = Counter()
+        self.num_docs = 0
+
+    def _unique_props(self, doc: Document) -> Collection[Property]:
+        props = self.property_fun(doc)
+        if self.count_only_selected:
+            indices = doc.selected.indices
+            indices = indices[indices < len(props)]
+            if isinstance(props, np.ndarray):
+                props = props[indices]
+            else:
+                props = [props[index] for index in indices.tolist()]
+
+        if isinstance(props, np.ndarray) and np.issubdtype(props.dtype, np.integer):
+            return np.unique(props).tolist()
+
+        return set(props)
+
+    def add(self, docs: Iterable[Document]) -> None:
+        """Count the properties of the given documents."""
+        for doc in docs:
+            self.document_freqs.update(self._unique_props(doc))
+            self.num_docs += 1
+
+    def remove(self, docs: Iterable[Document]) -> None:
+        """
+        Remove the previously added documents from the counts.
+
+        The documents must have the same properties (and selections,
+        if only selected tokens are counted) as when they were added.
+        """
+        # validate the whole batch first, such that the counts are left
+        # unchanged if any of the documents cannot be removed
+        removed_freqs: Counter[Property] = Counter()
+        num_removed = 0
+        for doc in docs:
+            removed_freqs.update(self._unique_props(doc))
+            num_removed += 1
+
+        if num_removed > self.num_docs or any(
+            self.document_freqs[prop] < count for prop, count in removed_freqs.items()
+        ):
+            raise ValueError("Cannot remove a document that was never added")
+
+        self.document_freqs.subtract(removed_freqs)
+        self.num_docs -= num_removed
+
+        # only keep properties that still occur in any document
+        self.document_freqs = +self.document_freqs
+
+    def get_props(
+        self,
+        min_num: Optional[int | float] = None,
+        max_num: Optional[int | float] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        interval_open: bool = False,
+    ) -> Set[Property]:
+        """
+        Return the properties with a document frequency within the given
+        interval, given the currently counted documents.
+
+        See get_props_by_document_frequency for more details.
+        """
+        return select_props_by_document_frequency(
+            self.document_freqs,
+            self.num_docs,
+            min_num=min_num,
+            max_num=max_num,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            interval_open=interval_open,
+        )
+
+    def get_filter(
+        self,
+        min_num: Optional[int | float] = None,
+        max_num: Optional[int | float] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        interval_open: bool = False,
+    ) -> Filter:
+        """
+        Return the filter that get_filter_by_frequency would create
+        for the currently counted documents.
+
+        The filter is not updated by later changes to the index.
+        """
+        return get_filter_by_property(
+            property_fun=self.property_fun,
+            req_properties=self.get_props(
+                min_num=min_num,
+                max_num=max_num,
+                min_rate=min_rate,
+                max_rate=max_rate,
+                interval_open=interval_open,
+            ),
+        )
+
+
 T = TypeVar("T")
 
 
@@ -184,16 +511,30 @@ def get_filter_by_subset_len(
     Filter tokens based on the length of document subsets they belong to.
 
     Example: filter based on the length of sentences.
+
+    If the split function declares the offsets at which it splits documents
+    (see its_prep.spacy.utils.splits_at), the documents are not split.
     """
+    return filter_from_mask(
+        partial(_subset_len_mask, split_fun, min_len, max_len, interval_open)
+    )
 
-    def filter_fun(doc: Document) -> Document:
-        len_by_token = [len(col) for col in split_fun(doc) for _ in col]
-        return doc.sub_doc(
-            {
-                index
-                for index, length in enumerate(len_by_token)
-                if __in_interval(length, min_len, max_len, interval_open)
-            }
-        )
 
-    return filter_fun
+def _subset_len_mask(
+    split_fun: Split_Function,
+    min_len: Optional[int],
+    max_len: Optional[int],
+    interval_open: bool,
+    doc: Document,
+) -> np.ndarray:
+    # split functions that declare their offsets do not need to split the document
+    offsets_fun = getattr(split_fun, "split_offsets", None)
+    if offsets_fun is not None:
+        lens = np.diff(offsets_fun(doc)).astype(np.intp, copy=False)
+    else:
+        lens = np.fromiter(map(len, split_fun(doc)), dtype=np.intp)
+
+    len_by_token = np.repeat(lens, lens)
+    return np.asarray(
+        __in_interval(len_by_token, min_len, max_len, interval_open), dtype=bool
+    )
@@ -6,33 +6,42 @@ These can be used as-is, or as guidance for defining new pipelines.
 To apply these pipelines to a document corpus, use the
 filter.apply_filters function.
 """
-from collections.abc import Callable, Collection, Iterator
-from typing import Any, TypeVar
+import pickle
+import tempfile
+from collections.abc import Callable, Collection, Iterable, Iterator
+from pathlib import Path
+from typing import Any, Optional, TypeVar
 
 import its_prep.spacy.props as nlp
 import its_prep.specs.collections as cols
 import its_prep.specs.filters as filters
-from its_prep.core import apply_filters
-from its_prep.types import Document, Pipeline, Pipeline_Generator, Property_Function
+from its_prep.core import Pipeline_Stats, apply_filters, apply_filters_parallel
+from its_prep.types import (
+    Array_Property_Function,
+    Document,
+    Filter,
+    Pipeline,
+    Pipeline_Generator,
+    Property_Function,
+)
 
 Upos = TypeVar("Upos")
 Lemma = TypeVar("Lemma")
 
 
-def get_generic_topic_modeling_pipelines(
+def get_generic_topic_modeling_filters(
     get_upos_fun: Property_Function[Upos],
-    is_stop_fun: Property_Function[bool],
+    is_stop_fun: Property_Function[bool] | Array_Property_Function,
     lemmatize_fun: Property_Function[Lemma],
     ignored_upos_tags: Collection[Upos],
     ignored_lemmas: Collection[Lemma],
-    required_df_interval: dict[str, Any],
-) -> Iterator[Pipeline_Generator]:
+) -> Pipeline:
     """
-    Get the corpus-specific pipelines for topic modeling tasks.
+    Get the corpus-independent filters for topic modeling tasks,
+    i.e. all filters except the one based on document frequency.
     See apply_generic_topic_modeling for more details.
     """
-    # filter by everything but document frequency
-    yield lambda docs, **kwargs: [
+    return [
         # filter by upos tags
         filters.negated(
             filters.get_filter_by_property(get_upos_fun, ignored_upos_tags)
@@ -43,6 +52,28 @@ def get_generic_topic_modeling_pipelines(
         filters.negated(filters.get_filter_by_property(lemmatize_fun, ignored_lemmas)),
     ]
 
+
+def get_generic_topic_modeling_pipelines(
+    get_upos_fun: Property_Function[Upos],
+    is_stop_fun: Property_Function[bool] | Array_Property_Function,
+    lemmatize_fun: Property_Function[Lemma],
+    ignored_upos_tags: Collection[Upos],
+    ignored_lemmas: Collection[Lemma],
+    required_df_interval: dict[str, Any],
+) -> Iterator[Pipeline_Generator]:
+    """
+    Get the corpus-specific pipelines for topic modeling tasks.
+    See apply_generic_topic_modeling for more details.
+    """
+    # filter by everything but document frequency
+    yield lambda docs, **kwargs: get_generic_topic_modeling_filters(
+        get_upos_fun=get_upos_fun,
+        is_stop_fun=is_stop_fun,
+        lemmatize_fun=lemmatize_fun,
+        ignored_upos_tags=ignored_upos_tags,
+        ignored_lemmas=ignored_lemmas,
+    )
+
     yield lambda docs, **kwargs: [
         filters.get_filter_by_frequency(
             docs,
@@ -55,11 +86,14 @@ def get_generic_topic_modeling_pipelines(
 def apply_generic_topic_modeling(
     docs: Collection[Document],
     get_upos_fun: Property_Function[Upos],
-    is_stop_fun: Property_Function[bool],
+    is_stop_fun: Property_Function[bool] | Array_Property_Function,
     lemmatize_fun: Property_Function[Lemma],
     ignored_upos_tags: Collection[Upos],
     ignored_lemmas: Collection[Lemma],
     required_df_interval: dict[str, Any],
+    fused: bool = False,
+    n_jobs: Optional[int] = None,
+    stats: Optional[Pipeline_Stats] = None,
 ) -> Collection[Document]:
     """
     Pipeline of filter functions used during pre-processing for topic modeling.
@@ -73,6 +107,12 @@ def apply_generic_topic_modeling(
       Specification of the document frequency interval
       that tokens must fall into.
       See documentation of filter_specs.get_filter_by_frequency_in_interval.
+    :param fused: Whether to evaluate the filters of each stage at once.
+                  See its_prep.core.compile_pipeline.
+    :param n_jobs: If given, distribute the filtering onto this many processes.
+                   See its_prep.core.apply_filters_parallel.
+    :param stats: If given, record the measurements of each filter in it.
+                  See its_prep.core.apply_filters.
     """
     get_pipeline_funs = get_generic_topic_modeling_pipelines(
         get_upos_fun=get_upos_fun,
@@ -85,49 +125,219 @@ def apply_generic_topic_modeling(
 
     for fun in get_pipeline_funs:
         pipeline = fun(docs)
-        docs = list(apply_filters(docs, pipeline))
+        docs = list(
+            _apply_stage(docs, pipeline, fused=fused, n_jobs=n_jobs, stats=stats)
+        )
 
     return docs
 
 
+def _apply_stage(
+    docs: Collection[Document],
+    pipeline: Pipeline,
+    fused: bool,
+    n_jobs: Optional[int],
+    stats: Optional[Pipeline_Stats] = None,
+) -> Iterator[Document]:
+    if n_jobs is None:
+        return apply_filters(docs, pipeline, fused=fused, stats=stats)
+
+    return apply_filters_parallel(
+        docs, pipeline, n_jobs=n_jobs, fused=fused, stats=stats
+    )
+
+
+def _read_spilled_batches(file) -> Iterator[Document]:
+    """Read back documents that were written to the file in pickled batches."""
+    file.seek(0)
+    while True:
+        try:
+            yield from pickle.load(file)
+        except EOFError:
+            return
+
+
+def stream_generic_topic_modeling(
+    docs: Iterable[Document],
+    get_upos_fun: Property_Function[Upos],
+    is_stop_fun: Property_Function[bool] | Array_Property_Function,
+    lemmatize_fun: Property_Function[Lemma],
+    ignored_upos_tags: Collection[Upos],
+    ignored_lemmas: Collection[Lemma],
+    required_df_interval: dict[str, Any],
+    fused: bool = False,
+    spill_dir: Optional[Path] = None,
+    batch_size: int = 1024,
+    stats: Optional[Pipeline_Stats] = None,
+) -> Iterator[Document]:
+    """
+    Like apply_generic_topic_modeling, but without keeping the corpus in memory.
+
+    In a first pass, the corpus-independent filters are applied and
+    the document frequencies are counted. In a second pass,
+    the documents are filtered by their document frequency.
+    The results are returned lazily, in the original order.
+
+    If the given documents can be iterated over multiple times
+    (e.g. a list or a class that reads the corpus from disk on each iteration),
+    the first filters are simply applied again during the second pass.
+    Otherwise, or if spill_dir is given, the results of the first pass are
+    temporarily written to disk, in batches of the given size.
+
+    :param spill_dir: The directory to create the temporary file in.
+                      Defaults to the system's temporary directory.
+    :param batch_size: The number of documents to write to or read from
+                       the temporary file at once.
+    :param stats: If given, record the measurements of each filter in it.
+                  See its_prep.core.apply_filters.
+    """
+    pipeline = get_generic_topic_modeling_filters(
+        get_upos_fun=get_upos_fun,
+        is_stop_fun=is_stop_fun,
+        lemmatize_fun=lemmatize_fun,
+        ignored_upos_tags=ignored_upos_tags,
+        ignored_lemmas=ignored_lemmas,
+    )
+    df_interval = dict(required_df_interval)
+    count_only_selected = df_interval.pop("count_only_selected", False)
+
+    def count_freqs(docs: Iterable[Document]) -> Filter:
+        dfs, num_docs = filters.count_document_frequencies(
+            docs, lemmatize_fun, count_only_selected=count_only_selected
+        )
+        props = filters.select_props_by_document_frequency(dfs, num_docs, **df_interval)
+        return filters.get_filter_by_property(lemmatize_fun, props)
+
+    # the source can be iterated over again.
+    # only the second pass is measured, such that each filter is measured
+    # once per document, as when spilling the documents
+    if spill_dir is None and iter(docs) is not docs:
+        df_filter = count_freqs(apply_filters(docs, pipeline, fused=fused))
+        yield from apply_filters(
+            docs, list(pipeline) + [df_filter], fused=fused, stats=stats
+        )
+        return
+
+    with tempfile.TemporaryFile(dir=spill_dir) as file:
+
+        def filter_and_spill() -> Iterator[Document]:
+            # spill the documents while counting their document frequencies
+            batch: list[Document] = []
+            for doc in apply_filters(docs, pipeline, fused=fused, stats=stats):
+                batch.append(doc)
+                yield doc
+
+                if len(batch) >= batch_size:
+                    pickle.dump(batch, file)
+                    batch = []
+
+            if batch:
+                pickle.dump(batch, file)
+
+        df_filter = count_freqs(filter_and_spill())
+        yield from apply_filters(
+            _read_spilled_batches(file), [df_filter], fused=fused, stats=stats
+        )
+
+
+# the defaults used for the PoC topic modeling application
+_poc_required_df_interval: dict[str, Any] = {
+    "min_num": 5,
+    "max_rate": 0.25,
+    "interval_open": False,
+    "count_only_selected": True,
+}
+_poc_ignored_upos_tags: Collection[str] = {"PUNCT", "SPACE"}
+_poc_ignored_lemmas: Collection[str] = set().union(
+    cols.symbols,
+    cols.fillers,
+    cols.lrts,
+    cols.sources,
+    cols.target_audiences,
+)
+
+
 def get_poc_topic_modeling_pipelines(
-    required_df_interval: dict[str, Any] = {
-        "min_num": 5,
-        "max_rate": 0.25,
-        "interval_open": False,
-        "count_only_selected": True,
-    },
-    ignored_upos_tags: Collection[str] = {"PUNCT", "SPACE"},
-    ignored_lemmas=set().union(
-        cols.symbols,
-        cols.fillers,
-        cols.lrts,
-        cols.sources,
-        cols.target_audiences,
-    ),
+    required_df_interval: dict[str, Any] = _poc_required_df_interval,
+    ignored_upos_tags: Collection[str] = _poc_ignored_upos_tags,
+    ignored_lemmas: Collection[str] = _poc_ignored_lemmas,
 ) -> Iterator[Pipeline_Generator]:
     """The particular pipeline used for the PoC topic modeling application."""
+    # use the array-valued properties, which allow for vectorized filtering
     return get_generic_topic_modeling_pipelines(
-        lemmatize_fun=nlp.lemmatize,
-        get_upos_fun=nlp.get_upos,
-        is_stop_fun=nlp.is_stop,
+        lemmatize_fun=nlp.lemmatize_ids,
+        get_upos_fun=nlp.get_upos_ids,
+        is_stop_fun=nlp.is_stop_array,
         # ignore punctuation and white-space
-        ignored_upos_tags=ignored_upos_tags,
+        ignored_upos_tags=set(nlp.utils.string_ids(ignored_upos_tags).tolist()),
         # lemmas must be in at least five and at most 25% of documents
         required_df_interval=required_df_interval,
         # ignore the following lemmas
-        ignored_lemmas=ignored_lemmas,
+        ignored_lemmas=set(nlp.utils.string_ids(ignored_lemmas).tolist()),
+    )
+
+
+def get_poc_topic_modeling_components() -> frozenset[str]:
+    """
+    The spaCy components that the PoC topic modeling pipeline depends on.
+
+    Analyzing the documents with only these enabled skips e.g. the parser
+    and the named entity recognizer. See its_prep.spacy.utils.only_components.
+    """
+    return nlp.utils.get_required_components(
+        nlp.lemmatize_ids, nlp.get_upos_ids, nlp.is_stop_array
     )
 
 
 def apply_poc_topic_modeling(
-    docs: Collection[Document], **kwargs
+    docs: Collection[Document],
+    fused: bool = False,
+    n_jobs: Optional[int] = None,
+    stats: Optional[Pipeline_Stats] = None,
+    **kwargs,
 ) -> Collection[Document]:
-    """The particular pipeline used for the PoC topic modeling application."""
+    """
+    The particular pipeline used for the PoC topic modeling application.
+
+    :param fused: Whether to evaluate the filters of each stage at once.
+                  See its_prep.core.compile_pipeline.
+    :param n_jobs: If given, distribute the filtering onto this many processes.
+                   See its_prep.core.apply_filters_parallel.
+    :param stats: If given, record the measurements of each filter in it.
+                  See its_prep.core.apply_filters.
+    """
     get_pipeline_funs = get_poc_topic_modeling_pipelines(**kwargs)
 
     for fun in get_pipeline_funs:
         pipeline = fun(docs)
-        docs = list(apply_filters(docs, pipeline))
+        docs = list(
+            _apply_stage(docs, pipeline, fused=fused, n_jobs=n_jobs, stats=stats)
+        )
 
     return docs
+
+
+def stream_poc_topic_modeling(
+    docs: Iterable[Document],
+    required_df_interval: dict[str, Any] = _poc_required_df_interval,
+    ignored_upos_tags: Collection[str] = _poc_ignored_upos_tags,
+    ignored_lemmas: Collection[str] = _poc_ignored_lemmas,
+    **kwargs,
+) -> Iterator[Document]:
+    """
+    The particular pipeline used for the PoC topic modeling application,
+    without keeping the corpus in memory.
+
+    Any additional keyword arguments are passed onto
+    stream_generic_topic_modeling.
+    """
+    return stream_generic_topic_modeling(
+        docs,
+        lemmatize_fun=nlp.lemmatize_ids,
+        get_upos_fun=nlp.get_upos_ids,
+        is_stop_fun=nlp.is_stop_array,
+        ignored_upos_tags=set(nlp.utils.string_ids(ignored_upos_tags).tolist()),
+        required_df_interval=required_df_interval,
+        ignored_lemmas=set(nlp.utils.string_ids(ignored_lemmas).tolist()),
+        **kwargs,
+    )
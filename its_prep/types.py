@@ -1,77 +1,579 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+from collections import OrderedDict
 from collections.abc import Callable, Collection, Iterable, Iterator, Sequence, Set
-from dataclasses import dataclass
-from typing import Protocol, TypeVar
+from dataclasses import FrozenInstanceError, dataclass
+from typing import Any, Optional, Protocol, TypeVar
 
+import numpy as np
 import py3langid as langid
 
 Tokens = tuple[str, ...]
 
 
-@dataclass(frozen=True, eq=True)
+class Selection(Set[int]):
+    """
+    An immutable set of token indices, backed by a sorted NumPy array.
+
+    Intersections, unions and differences between selections are vectorized.
+    Selections compare equal to (frozen)sets with the same elements.
+    """
+
+    __slots__ = ("indices", "_hash_value")
+
+    indices: np.ndarray
+
+    def __init__(self, indices: Iterable[int] = ()):
+        if isinstance(indices, Selection):
+            array = indices.indices
+        elif isinstance(indices, range) and indices.step == 1:
+            array = np.arange(indices.start, max(indices.start, indices.stop))
+        else:
+            if not isinstance(indices, np.ndarray):
+                indices = np.fromiter(indices, dtype=np.intp)
+            array = np.unique(indices.astype(np.intp, copy=False))
+
+        array.flags.writeable = False
+        self.indices = array
+        self._hash_value: int | None = None
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable[int]) -> Selection:  # type: ignore[override]
+        return cls(it)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> Selection:
+        """The selection of the indices at which the boolean mask is True."""
+        return cls(np.flatnonzero(mask))
+
+    def to_mask(self, size: int) -> np.ndarray:
+        """A boolean mask of the given size that is True at each selected index."""
+        mask = np.zeros(size, dtype=bool)
+        mask[self.indices[self.indices < size]] = True
+        return mask
+
+    def _as_selection(self, other: Iterable[Any]) -> Selection:
+        """Convert other to a selection, ignoring any impossible indices."""
+        if isinstance(other, Selection):
+            return other
+
+        if len(self.indices) == 0:
+            return Selection()
+
+        lower, upper = self.indices[0], self.indices[-1]
+        return Selection(
+            int(value)
+            for value in other
+            if isinstance(value, (int, np.integer)) and lower <= value <= upper
+        )
+
+    def __contains__(self, obj: object) -> bool:
+        if not isinstance(obj, (int, np.integer)) or len(self.indices) == 0:
+            return False
+
+        if not self.indices[0] <= obj <= self.indices[-1]:
+            return False
+
+        index = np.searchsorted(self.indices, obj)
+        return bool(self.indices[index] == obj)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices.tolist())
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __and__(self, other: Iterable[Any]) -> Selection:
+        if not isinstance(other, Iterable):
+            return NotImplemented
+
+        other = self._as_selection(other)
+        return Selection(
+            np.intersect1d(self.indices, other.indices, assume_unique=True)
+        )
+
+    __rand__ = __and__
+
+    def __or__(self, other: Iterable[Any]) -> Set[Any]:
+        if not isinstance(other, Iterable):
+            return NotImplemented
+
+        if not isinstance(other, Selection):
+            other = list(other)
+            if not all(isinstance(value, (int, np.integer)) for value in other):
+                # the union is not a set of indices
+                return frozenset(self).union(other)
+
+            other = Selection(other)
+
+        return Selection(np.union1d(self.indices, other.indices))
+
+    __ror__ = __or__
+
+    def __sub__(self, other: Iterable[Any]) -> Selection:
+        if not isinstance(other, Iterable):
+            return NotImplemented
+
+        other = self._as_selection(other)
+        return Selection(np.setdiff1d(self.indices, other.indices, assume_unique=True))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Selection):
+            return np.array_equal(self.indices, other.indices)
+
+        return super().__eq__(other)
+
+    def __hash__(self) -> int:
+        # compatible with the hash of frozensets with the same elements
+        if self._hash_value is None:
+            self._hash_value = self._hash()
+
+        return self._hash_value
+
+    def issubset(self, other: Iterable[Any]) -> bool:
+        if isinstance(other, Selection):
+            return bool(np.isin(self.indices, other.indices).all())
+
+        if not isinstance(other, Collection):
+            other = frozenset(other)
+
+        return all(index in other for index in self)
+
+    def issuperset(self, other: Iterable[Any]) -> bool:
+        if isinstance(other, Selection):
+            return bool(np.isin(other.indices, self.indices).all())
+
+        return all(value in self for value in other)
+
+    def union(self, *others: Iterable[Any]) -> Set[Any]:
+        result: Set[Any] = self
+        for other in others:
+            result = result | (other if isinstance(other, Set) else frozenset(other))
+
+        return result
+
+    def intersection(self, *others: Iterable[Any]) -> Selection:
+        result = self
+        for other in others:
+            result = result & other
+
+        return result
+
+    def difference(self, *others: Iterable[Any]) -> Selection:
+        result = self
+        for other in others:
+            result = result - other
+
+        return result
+
+    def copy(self) -> Selection:
+        # selections are immutable, like frozensets
+        return self
+
+    def __repr__(self) -> str:
+        return f"Selection({self.indices.tolist()})"
+
+
+def content_digest(*strings: str) -> int:
+    """
+    A stable 128 bit digest of the given strings.
+
+    Unlike hash(), the digest is the same in every process,
+    so it can also be used to identify contents on disk.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for string in strings:
+        encoded = string.encode("utf-8", errors="surrogatepass")
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+
+    return int.from_bytes(digest.digest(), "little")
+
+
+# the detected languages of recently classified texts, by content digest,
+# such that the cache does not keep the texts themselves alive
+_languages: OrderedDict[int, str] = OrderedDict()
+_MAX_LANGUAGES = 2**16
+_languages_lock = threading.Lock()
+
+
+def detect_language(text: str) -> str:
+    """Classify the language of the given text, caching the result by content."""
+    return detect_languages([text])[0]
+
+
+def detect_languages(texts: Iterable[str]) -> list[str]:
+    """
+    Classify the languages of a batch of texts.
+
+    Each distinct text of the batch is only classified once,
+    and texts that were classified before are taken from the cache,
+    which keeps the languages of the last 2**16 distinct texts.
+    """
+    texts = list(texts)
+    digests = [content_digest(text) for text in texts]
+
+    languages: dict[int, str] = dict()
+    with _languages_lock:
+        for digest in digests:
+            if digest in _languages:
+                _languages.move_to_end(digest)
+                languages[digest] = _languages[digest]
+
+    missing = {
+        digest: text for digest, text in zip(digests, texts) if digest not in languages
+    }
+    for digest, text in missing.items():
+        language, _ = langid.classify(text)
+        assert isinstance(language, str)
+        languages[digest] = language
+
+    with _languages_lock:
+        for digest in missing:
+            _languages[digest] = languages[digest]
+        while len(_languages) > _MAX_LANGUAGES:
+            _languages.popitem(last=False)
+
+    return [languages[digest] for digest in digests]
+
+
+# the distinct token strings of all interned tokens of this process,
+# and the ID of each string
+_token_strings: list[str] = []
+_token_ids: dict[str, int] = dict()
+# guards the vocabulary, such that each string gets exactly one ID
+_token_lock = threading.Lock()
+
+
+def _intern_token(token: str) -> int:
+    # must be called while holding _token_lock
+    token_id = _token_ids.get(token)
+    if token_id is None:
+        token_id = _token_ids[token] = len(_token_strings)
+        _token_strings.append(token)
+
+    return token_id
+
+
+def intern_tokens(tokens: Iterable[str]) -> Interned_Tokens:
+    """
+    Store the tokens as IDs into a vocabulary shared by all documents,
+    such that each distinct token string is only kept in memory once.
+
+    Note that the vocabulary only grows for the lifetime of the process.
+    It is shared by all threads.
+    """
+    # consume the tokens before taking the lock
+    tokens = list(tokens)
+    with _token_lock:
+        ids = np.fromiter(map(_intern_token, tokens), dtype=np.uint32)
+
+    return Interned_Tokens(ids)
+
+
+class Interned_Tokens(Sequence[str]):
+    """
+    An immutable sequence of tokens, stored as IDs into the shared vocabulary.
+
+    The token strings are only looked up when they are accessed.
+    Interned tokens compare equal to tuples of the same tokens.
+    """
+
+    __slots__ = ("ids",)
+
+    ids: np.ndarray
+
+    def __init__(self, ids: np.ndarray):
+        ids.flags.writeable = False
+        self.ids = ids
+
+    def take(self, indices: np.ndarray) -> Tokens:
+        """The tokens at the given indices."""
+        return tuple(map(_token_strings.__getitem__, self.ids[indices].tolist()))
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self.ids))[index])
+
+        return _token_strings[self.ids[index]]
+
+    def __iter__(self) -> Iterator[str]:
+        return map(_token_strings.__getitem__, self.ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Interned_Tokens):
+            return np.array_equal(self.ids, other.ids)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        # compatible with the hash of tuples of the same tokens
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # the IDs are only valid within this process
+        return intern_tokens, (tuple(self),)
+
+    def __repr__(self) -> str:
+        return tuple(self).__repr__()
+
+
+@dataclass(frozen=True)
+class _Document_Fields:
+    """The fields of Document, as seen by the dataclasses module."""
+
+    original_text: str
+    original_tokens: Tokens | Interned_Tokens
+    selected: Selection
+    language: Optional[str] = None
+
+
 class Document:
+    """
+    A tokenized document, together with the indices of its selected tokens.
+
+    Documents are immutable; filters create sub-documents through sub_doc.
+    The attributes are stored in slots. Compact documents additionally
+    store their tokens through intern_tokens, see Document.compact.
+
+    Documents still declare the fields of the former dataclass, such that
+    dataclasses.fields, replace and asdict keep working.
+    Note that these access the language, which detects it for lazy documents.
+    """
+
+    __slots__ = (
+        "original_text",
+        "original_tokens",
+        "selected",
+        "_language",
+        "_digest",
+        "_text_digest",
+        "_selected_tokens",
+        "__weakref__",
+    )
+
     original_text: str
-    original_tokens: Tokens
-    selected: frozenset[int]
-    language: str
+    original_tokens: Tokens | Interned_Tokens
+    selected: Selection
+    _language: Optional[str]
+    _digest: Optional[int]
+    _text_digest: Optional[int]
+    _selected_tokens: Optional[Tokens]
+
+    __dataclass_fields__ = _Document_Fields.__dataclass_fields__
+
+    def __init__(
+        self,
+        original_text: str,
+        original_tokens: Tokens | Interned_Tokens,
+        selected: Iterable[int],
+        # if None, the language is detected on first access
+        language: Optional[str] = None,
+    ):
+        _set = object.__setattr__
+        _set(self, "original_text", original_text)
+        _set(self, "original_tokens", original_tokens)
+        _set(
+            self,
+            "selected",
+            selected if isinstance(selected, Selection) else Selection(selected),
+        )
+        _set(self, "_language", language)
+        _set(self, "_digest", None)
+        _set(self, "_text_digest", None)
+        _set(self, "_selected_tokens", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise FrozenInstanceError(f"cannot assign to field {name!r}")
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field {name!r}")
+
+    def __reduce__(self):
+        return Document, (
+            self.original_text,
+            self.original_tokens,
+            self.selected,
+            self._language,
+        )
+
+    @property
+    def language(self) -> Optional[str]:
+        """The language of the document, detected on first access if not given."""
+        if self._language is None:
+            object.__setattr__(self, "_language", detect_language(self.original_text))
+
+        return self._language
 
     @property
     def selected_tokens(self) -> Tokens:
-        return tuple(self.original_tokens[index] for index in self.selected)
+        if self._selected_tokens is not None:
+            return self._selected_tokens
+
+        tokens = self.original_tokens
+        if isinstance(tokens, Interned_Tokens):
+            # resolved on each access, so the strings are not kept per document
+            return tokens.take(self.selected.indices)
+
+        selected_tokens = tuple(tokens[index] for index in self.selected)
+        object.__setattr__(self, "_selected_tokens", selected_tokens)
+        return selected_tokens
+
+    @property
+    def digest(self) -> int:
+        """
+        The content digest of the original text and tokens.
+
+        It is shared by all sub-documents and identifies the document
+        in the spaCy caches, see content_digest.
+        """
+        digest = self._digest
+        if digest is None:
+            digest = content_digest(self.original_text, *self.original_tokens)
+            object.__setattr__(self, "_digest", digest)
+
+        return digest
+
+    @property
+    def text_digest(self) -> int:
+        """
+        The content digest of the original text alone.
+
+        It identifies the spaCy analysis of the text, see content_digest.
+        """
+        digest = self._text_digest
+        if digest is None:
+            digest = content_digest(self.original_text)
+            object.__setattr__(self, "_text_digest", digest)
+
+        return digest
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Document):
+            return NotImplemented
+
+        # documents with different contents are told apart by their digests,
+        # without comparing their full texts.
+        # the language is not compared, as it is detected from the contents
+        # and comparing it would trigger the detection for lazy documents
+        return self is other or (
+            self.digest == other.digest
+            and self.selected == other.selected
+            and self.original_text == other.original_text
+            and self.original_tokens == other.original_tokens
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.digest, self.selected))
 
     @classmethod
     def make(
         cls,
         original_text: str,
-        original_tokens: Tokens,
+        original_tokens: Tokens | Interned_Tokens,
         selected: Iterable[int],
         language: str | None = None,
+        lazy_language: bool = False,
+        compact: bool = False,
     ) -> Document:
-        if language is None:
-            language, _ = langid.classify(original_text)
-            assert isinstance(language, str)
+        """
+        :param language: The language of the document.
+                         If not given, it is detected from the original text.
+        :param lazy_language: Whether to only detect the language
+                              once it is first accessed.
+        :param compact: Whether to store the tokens through intern_tokens.
+        """
+        if language is None and not lazy_language:
+            language = detect_language(original_text)
+
+        if compact and not isinstance(original_tokens, Interned_Tokens):
+            original_tokens = intern_tokens(original_tokens)
 
         return Document(
             original_text=original_text,
             original_tokens=original_tokens,
-            selected=frozenset(selected),
+            selected=Selection(selected),
             language=language,
         )
 
     @classmethod
-    def fromtext(cls, text: str, tokenize_fun: Callable[[str], Tokens]) -> Document:
+    def fromtext(
+        cls,
+        text: str,
+        tokenize_fun: Callable[[str], Tokens],
+        language: str | None = None,
+        lazy_language: bool = False,
+        compact: bool = False,
+    ) -> Document:
         tokens = tokenize_fun(text)
         return Document.make(
             original_text=text,
             original_tokens=tokens,
             selected=range(len(tokens)),
+            language=language,
+            lazy_language=lazy_language,
+            compact=compact,
         )
 
     @classmethod
-    def fromtokens(cls, __iterable: Iterable[str]) -> Document:
+    def fromtokens(
+        cls,
+        __iterable: Iterable[str],
+        language: str | None = None,
+        lazy_language: bool = False,
+        compact: bool = False,
+    ) -> Document:
         tokens = Tokens(__iterable)
         text = " ".join(tokens)
         return Document.make(
             original_text=text,
             original_tokens=tokens,
             selected=range(len(tokens)),
+            language=language,
+            lazy_language=lazy_language,
+            compact=compact,
         )
 
-    def sub_doc(self, selected_indices: Set[int]) -> Document:
-        return Document(
+    def _with(self, tokens: Tokens | Interned_Tokens, selected: Selection) -> Document:
+        doc = Document(
             original_text=self.original_text,
-            original_tokens=self.original_tokens,
-            selected=self.selected & selected_indices,
-            language=self.language,
+            original_tokens=tokens,
+            selected=selected,
+            # do not trigger the language detection
+            language=self._language,
         )
+        # the contents are unchanged, so their digests can be re-used
+        object.__setattr__(doc, "_digest", self.digest)
+        object.__setattr__(doc, "_text_digest", self._text_digest)
+        return doc
+
+    def sub_doc(self, selected_indices: Iterable[int]) -> Document:
+        return self._with(self.original_tokens, self.selected & selected_indices)
+
+    def compact(self) -> Document:
+        """
+        The same document, with its tokens stored through intern_tokens.
+
+        Across large corpora, this stores each distinct token string only once.
+        """
+        if isinstance(self.original_tokens, Interned_Tokens):
+            return self
+
+        return self._with(intern_tokens(self.original_tokens), self.selected)
 
     # a document is a Collection over its selected tokens
     def __iter__(self) -> Iterator[str]:
         return self.selected_tokens.__iter__()
 
     def __len__(self) -> int:
-        return len(self.selected_tokens)
+        return len(self.selected)
 
     def __contains__(self, obj) -> bool:
         return obj in self.selected_tokens
@@ -99,6 +601,27 @@ class Filter(Protocol):
 
 Pipeline = Sequence[Filter]
 
+
+class Mask_Function(Protocol):
+    """
+    Functions that decide which tokens of a document to keep.
+
+    Filters defined through mask functions can be fused with one another,
+    see its_prep.specs.filters.filter_from_mask.
+    """
+
+    def __call__(self, doc: Document) -> np.ndarray:
+        """
+        Return a boolean array that is True for each *original* token to keep.
+
+        I.e. len(result) == len(doc.original_tokens)
+
+        The result must only depend on the original document,
+        not on its currently selected tokens.
+        """
+        ...
+
+
 Property = TypeVar("Property", covariant=True)
 
 
@@ -116,15 +639,34 @@ class Property_Function(Protocol[Property]):
         ...
 
 
+class Array_Property_Function(Protocol):
+    """
+    Functions that compute some property for the tokens of the document,
+    returning the properties of all tokens as a single NumPy array.
+
+    Example: the spaCy IDs of the tokens' texts, see its_prep.spacy.vectors.
+    """
+
+    def __call__(self, doc: Document) -> np.ndarray:
+        """
+        Return the property of each *original* token in the document.
+
+        I.e. len(result) == len(doc.original_tokens)
+        """
+        ...
+
+
 class Split_Function(Protocol[Property]):
     """
     Functions that compute some property for the tokens of the document,
     splitting them into nested collections.
 
     Example: a function that splits a document into its sentences.
+    The nested collections may also be NumPy arrays,
+    e.g. when splitting the values of an Array_Property_Function.
     """
 
-    def __call__(self, doc: Document) -> Sequence[Sequence[Property]]:
+    def __call__(self, doc: Document) -> Sequence[Sequence[Property] | np.ndarray]:
         """
         Return the property of each *original* token in the document,
         organized by the split semantic.
@@ -1,9 +1,15 @@
 from __future__ import annotations
 from collections import defaultdict
-from collections.abc import Callable, Iterable
-from typing import Optional, TypeVar, Generic
+from collections.abc import Callable, Hashable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Optional, TypeVar, Generic
 from pathlib import Path
+import json
+import os
 import pickle
+import sys
+import tempfile
+import numpy as np
 import spacy
 import spacy.tokens
 
@@ -24,31 +30,235 @@ def nest(fun: Callable[[T], T], n: int) -> Callable[[T], T]:
     return nested_fun
 
 
+@dataclass
+class Cache_Stats:
+    """Usage statistics of a cache, since its counters were last reset."""
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    # the estimated size of all entries, e.g. in bytes, if known
+    size: Optional[int]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
 class Keyed_defaultdict(defaultdict, Generic[_KT, _VT]):
-    """A custom version defaultdict that supports keyed factories"""
+    """
+    A custom version defaultdict that supports keyed factories.
+
+    Optionally, the number of stored entries and their total estimated size
+    can be bounded. If a bound is exceeded, the least recently used entries
+    are evicted until the bounds are satisfied again.
+
+    Optionally, entries can be stored under a function of their keys,
+    e.g. a digest of large keys, such that the keys themselves are not kept.
+    The default factory still receives the original key.
+    """
 
     default_factory: Callable[[_KT], _VT]
 
-    def __init__(self, default_factory: Callable[[_KT], _VT]):
+    def __init__(
+        self,
+        default_factory: Callable[[_KT], _VT],
+        max_entries: Optional[int] = None,
+        max_size: Optional[int] = None,
+        size_fun: Callable[[_VT], int] = lambda _: 1,
+        key_fun: Optional[Callable[[_KT], Hashable]] = None,
+    ):
+        """
+        :param max_entries: The maximum number of stored entries.
+                            Unbounded if not given.
+        :param max_size: The maximum total size of the stored entries,
+                         as estimated by size_fun. Unbounded if not given.
+        :param size_fun: The function used to estimate the size of an entry.
+        :param key_fun: The function that computes the key to store
+                        each entry under. By default, the key itself is used.
+        """
         self.default_factory = default_factory
+        self.size_fun = size_fun
+        self.key_fun = key_fun
+        self._sizes: dict[Hashable, int] = dict()
+        self.total_size = 0
+        self.reset_stats()
+        self.set_limits(max_entries=max_entries, max_size=max_size)
+
+    def reset_stats(self) -> None:
+        """Reset the counters of hits, misses and evictions."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self) -> Cache_Stats:
+        return Cache_Stats(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            entries=len(self),
+            size=self.total_size,
+        )
+
+    def set_limits(
+        self, max_entries: Optional[int] = None, max_size: Optional[int] = None
+    ) -> None:
+        """Change the bounds of the dictionary, evicting entries if necessary."""
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._evict()
+
+    @property
+    def is_bounded(self) -> bool:
+        return self.max_entries is not None or self.max_size is not None
+
+    def _stored_key(self, __key: _KT) -> Hashable:
+        return self.key_fun(__key) if self.key_fun is not None else __key
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until all bounds are met"""
+        while len(self) > 0 and (
+            (self.max_entries is not None and len(self) > self.max_entries)
+            or (self.max_size is not None and self.total_size > self.max_size)
+        ):
+            # dictionaries are ordered by insertion,
+            # and accessed entries are re-inserted at the end
+            self._delete_stored(next(iter(self)))
+            self.evictions += 1
+
+    def _set_stored(self, stored_key: Hashable, value: _VT) -> None:
+        """Set the value of the entry with the given stored key."""
+        if dict.__contains__(self, stored_key):
+            self._delete_stored(stored_key)
+
+        size = self.size_fun(value)
+        dict.__setitem__(self, stored_key, value)
+        self._sizes[stored_key] = size
+        self.total_size += size
+        self._evict()
+
+    def _delete_stored(self, stored_key: Hashable) -> None:
+        dict.__delitem__(self, stored_key)
+        self.total_size -= self._sizes.pop(stored_key)
 
     def __missing__(self, __key: _KT) -> _VT:
         """Override the missing method in order to pass the looked up key to the factory"""
+        return self._missing(__key, self._stored_key(__key))
+
+    def _missing(self, __key: _KT, stored_key: Hashable) -> _VT:
         value = self.default_factory(__key)
-        self[__key] = value
+        self._set_stored(stored_key, value)
         return value
 
+    def __getitem__(self, __key: _KT) -> _VT:
+        return self.lookup(__key, self._stored_key(__key))
+
+    def lookup(self, __key: _KT, stored_key: Hashable) -> _VT:
+        """
+        Like self[key], given the stored key of the key.
+
+        This allows for computing expensive stored keys (e.g. digests) once,
+        rather than on each access.
+        """
+        if not dict.__contains__(self, stored_key):
+            self.misses += 1
+            return self._missing(__key, stored_key)
+
+        self.hits += 1
+        if self.is_bounded:
+            # mark the entry as the most recently used one
+            value = dict.pop(self, stored_key)
+            dict.__setitem__(self, stored_key, value)
+            return value
+
+        return dict.__getitem__(self, stored_key)
+
+    def __setitem__(self, __key: _KT, __value: _VT) -> None:
+        self._set_stored(self._stored_key(__key), __value)
+
+    def __delitem__(self, __key: _KT) -> None:
+        self._delete_stored(self._stored_key(__key))
+
+    def __contains__(self, __key: object) -> bool:
+        return self.contains_stored(self._stored_key(__key))  # type: ignore[arg-type]
+
+    def contains_stored(self, stored_key: Hashable) -> bool:
+        """Whether there is an entry with the given stored key."""
+        return dict.__contains__(self, stored_key)
+
+    def get(self, __key: _KT, default=None):
+        stored_key = self._stored_key(__key)
+        return dict.get(self, stored_key, default)
+
+    def pop(self, __key: _KT, *args):
+        stored_key = self._stored_key(__key)
+        if not dict.__contains__(self, stored_key):
+            return dict.pop(self, stored_key, *args)
+
+        value = dict.__getitem__(self, stored_key)
+        self._delete_stored(stored_key)
+        return value
+
+    def setdefault(self, __key: _KT, default=None):
+        stored_key = self._stored_key(__key)
+        if dict.__contains__(self, stored_key):
+            return dict.__getitem__(self, stored_key)
+
+        self[__key] = default
+        return default
+
+    def popitem(self) -> tuple[Hashable, _VT]:
+        # returns the stored key, as the original key is not kept
+        stored_key, value = dict.popitem(self)
+        self.total_size -= self._sizes.pop(stored_key)
+        return stored_key, value
+
+    def clear(self) -> None:
+        super().clear()
+        self._sizes.clear()
+        self.total_size = 0
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def update_stored(self, data: Mapping[Hashable, _VT]) -> None:
+        """Add entries that are given by their already stored keys."""
+        for stored_key, value in data.items():
+            self._set_stored(stored_key, value)
+
+    def copy(self) -> Keyed_defaultdict[_KT, _VT]:
+        obj = type(self)(
+            self.default_factory,
+            max_entries=self.max_entries,
+            max_size=self.max_size,
+            size_fun=self.size_fun,
+            key_fun=self.key_fun,
+        )
+        obj.update_stored(self)
+        return obj
+
     @classmethod
     def from_file(
-        cls, default_factory: Callable[[_KT], _VT], path: Path
+        cls, default_factory: Callable[[_KT], _VT], path: Path, **kwargs
     ) -> Keyed_defaultdict:
-        """A new keyed defaultdict with data from the given file path."""
+        """
+        A new keyed defaultdict with data from the given file path.
+
+        Any additional keyword arguments are passed onto the constructor.
+        """
         with open(path, "rb+") as f:
             # only load the underlying data
-            data = pickle.load(f)
+            version, data = _load_versioned(f, path)
 
-        obj = cls(default_factory)
-        obj.update(data)
+        obj = cls(default_factory, **kwargs)
+        if version < 2:
+            obj.update(data)
+        else:
+            obj.update_stored(data)
         return obj
 
     def save(self, path: Path) -> None:
@@ -60,10 +270,194 @@ class Keyed_defaultdict(defaultdict, Generic[_KT, _VT]):
         """
         with open(path, "wb+") as f:
             # only dump the underlying data
-            pickle.dump(dict(self), f)
+            _dump_versioned(dict(self), f)
+
+
+# the version of the files written by the save methods.
+# Files without a version (version 1) contain the original keys,
+# rather than the stored ones
+_FILE_FORMAT_VERSION = 2
+
+
+def _dump_versioned(data: object, file: BinaryIO) -> None:
+    pickle.dump({"its_prep_file_format": _FILE_FORMAT_VERSION, "data": data}, file)
+
+
+def _load_versioned(file: BinaryIO, path: Path) -> tuple[int, Any]:
+    """Load the data of a file written by _dump_versioned, and its version."""
+    data = pickle.load(file)
+    if not isinstance(data, dict) or "its_prep_file_format" not in data:
+        return 1, data
+
+    version = data["its_prep_file_format"]
+    if version > _FILE_FORMAT_VERSION:
+        raise ValueError(
+            f"{path} was written in file format {version}, "
+            f"but only formats up to {_FILE_FORMAT_VERSION} are supported"
+        )
+
+    return version, data["data"]
+
+
+# rough estimate of the memory used by each token of a spaCy document
+_SPACY_TOKEN_BYTES = 256
+
+
+def estimate_doc_size(doc: spacy.tokens.Doc) -> int:
+    """Estimate the memory used by a processed spaCy document, in bytes."""
+    tensor_size = getattr(doc.tensor, "nbytes", 0)
+    return len(doc.text) + len(doc) * _SPACY_TOKEN_BYTES + tensor_size
+
+
+def estimate_property_size(props: Sequence | np.ndarray) -> int:
+    """Estimate the memory used by the result of a property function, in bytes."""
+    if isinstance(props, np.ndarray):
+        return props.nbytes
+
+    return sys.getsizeof(props) + sum(
+        prop.nbytes if isinstance(prop, np.ndarray) else sys.getsizeof(prop)
+        for prop in props
+    )
+
+
+class Sharded_Doc_Store:
+    """
+    A directory of processed spaCy documents, stored under integer keys
+    (e.g. content digests) and spread over a fixed number of shards.
+
+    Multiple processes on the same machine may read from and write to
+    the same store concurrently. Each document is first written into a
+    temporary file inside its shard, which then atomically replaces the
+    document's final file. Thus, readers never see partially written
+    documents, and concurrent writers of the same key do not corrupt it.
+    """
+
+    def __init__(self, directory: Path, num_shards: int = 256):
+        """
+        :param num_shards: The number of shards to use for a new store.
+                           Existing stores keep their number of shards.
+        """
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # the first process to create the store decides its number of shards
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            meta = json.dumps({"num_shards": num_shards}).encode()
+            _write_exclusively(meta_path, meta)
+
+        with open(meta_path) as f:
+            self.num_shards: int = json.load(f)["num_shards"]
+
+    def _path(self, key: int) -> Path:
+        return self.directory / f"{key % self.num_shards:04x}" / f"{key:x}.spacy"
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, int) and self._path(key).exists()
+
+    def get(self, key: int, vocab: spacy.vocab.Vocab) -> Optional[spacy.tokens.Doc]:
+        """Load the document with the given key, if it has been stored."""
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+        return spacy.tokens.Doc(vocab).from_bytes(data)
+
+    def put(self, key: int, doc: spacy.tokens.Doc) -> None:
+        """Store the document under the given key, replacing any previous one."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        _write_atomically(path, doc.to_bytes())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob("*/*.spacy"))
+
+
+def _write_atomically(path: Path, data: bytes) -> None:
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=".", suffix=".tmp", delete=False
+    ) as f:
+        f.write(data)
+
+    os.replace(f.name, path)
+
+
+def _write_exclusively(path: Path, data: bytes) -> None:
+    """Like _write_atomically, but keep the file if it already exists."""
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=".", suffix=".tmp", delete=False
+    ) as f:
+        f.write(data)
+
+    try:
+        # unlike os.replace, linking fails if the file was created meanwhile
+        os.link(f.name, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(f.name)
 
 
 class Spacy_defaultdict(Keyed_defaultdict[_KT, spacy.tokens.Doc]):
+    """
+    A keyed defaultdict of processed spaCy documents.
+
+    Optionally, the dictionary can be backed by a Sharded_Doc_Store,
+    which must be keyed by the same stored keys (see key_fun).
+    Then, missing documents are loaded from the store before they are
+    computed, and all other added documents (computed, set or loaded from
+    files) are written into the store, as are those that were added before
+    the store was attached. This way, multiple processes can share their
+    processed documents.
+    """
+
+    backend: Optional[Sharded_Doc_Store] = None
+    vocab_fun: Optional[Callable[[], spacy.vocab.Vocab]] = None
+
+    def set_backend(
+        self,
+        backend: Optional[Sharded_Doc_Store],
+        vocab_fun: Optional[Callable[[], spacy.vocab.Vocab]] = None,
+    ) -> None:
+        """
+        Back the dictionary by the given store, or remove its backend if None.
+
+        :param vocab_fun: The function that returns the vocabulary
+                          to load documents from the store with.
+        """
+        self.backend = backend
+        self.vocab_fun = vocab_fun
+
+        # share the documents that were added before
+        if backend is not None:
+            for stored_key, doc in self.items():
+                if stored_key not in backend:
+                    backend.put(stored_key, doc)
+
+    def _missing(self, __key: _KT, stored_key: Hashable) -> spacy.tokens.Doc:
+        if self.backend is not None and self.vocab_fun is not None:
+            doc = self.backend.get(stored_key, self.vocab_fun())  # type: ignore[arg-type]
+            if doc is not None:
+                self._set_stored(stored_key, doc, publish=False)
+                return doc
+
+        return super()._missing(__key, stored_key)
+
+    def _set_stored(
+        self, stored_key: Hashable, value: spacy.tokens.Doc, publish: bool = True
+    ) -> None:
+        super()._set_stored(stored_key, value)
+
+        if publish and self.backend is not None:
+            self.backend.put(stored_key, value)  # type: ignore[arg-type]
+
+    def contains_stored(self, stored_key: Hashable) -> bool:
+        if super().contains_stored(stored_key):
+            return True
+
+        return self.backend is not None and stored_key in self.backend
+
     @classmethod
     def from_file(
         cls,
@@ -71,20 +465,24 @@ class Spacy_defaultdict(Keyed_defaultdict[_KT, spacy.tokens.Doc]):
         keys_path: Path,
         docs_path: Path,
         vocab: spacy.vocab.Vocab,
+        **kwargs,
     ) -> Spacy_defaultdict:
         # load the underlying keys
         with open(keys_path, "rb") as f:
-            keys: Iterable[_KT] = pickle.load(f)
+            version, keys = _load_versioned(f, keys_path)
 
         # load the underlying documents
         docbin = spacy.tokens.DocBin()
         docbin.from_disk(docs_path)
         docs = docbin.get_docs(vocab)
 
-        # combine them into the new cache
-        obj = cls(default_factory)
-        data = {key: doc for key, doc in zip(keys, docs)}
-        obj.update(data)
+        # combine them into the new cache.
+        # older files are migrated by computing the stored keys of their keys
+        obj = cls(default_factory, **kwargs)
+        if version < 2:
+            keys = [obj._stored_key(key) for key in keys]
+
+        obj.update_stored(dict(zip(keys, docs)))
         return obj
 
     def save(self, keys_path: Path, docs_path: Path) -> None:
@@ -96,7 +494,8 @@ class Spacy_defaultdict(Keyed_defaultdict[_KT, spacy.tokens.Doc]):
         """
         # dump the keys
         with open(keys_path, "wb+") as f:
-            pickle.dump(list(self.keys()), f)
+            _dump_versioned(list(self.keys()), f)
 
-        # dump the documents, using the DocBin utility from spacy
-        spacy.tokens.DocBin(docs=self.values()).to_disk(docs_path)
+        # dump the documents, using the DocBin utility from spacy.
+        # the user data records the components that were applied to them
+        spacy.tokens.DocBin(docs=self.values(), store_user_data=True).to_disk(docs_path)
@@ -78,3 +78,17 @@ def filters_unsafe(draw) -> Filter:
         return doc.sub_doc(selected)
 
     return filter_fun
+
+
+@st.composite
+def mask_filters(draw) -> Filter:
+    import its_prep.specs.filters as filter_specs
+
+    property_fun = draw(property_funs())
+    req_properties = draw(st.sets(texts_non_empty, max_size=3))
+    fun = filter_specs.get_filter_by_property(property_fun, req_properties)
+
+    if draw(st.booleans()):
+        fun = filter_specs.negated(fun)
+
+    return fun
@@ -1,9 +1,23 @@
+import pickle
 import test.strategies as lanst
+from collections import Counter
 
-from hypothesis import given
+import its_prep.specs.filters as filter_specs
+import numpy as np
+from hypothesis import given, settings
 from hypothesis import strategies as st
-from its_prep.core import apply_filters, selected_properties
-from its_prep.types import Document, Filter, Property_Function
+from its_prep.core import (
+    Pipeline_Stats,
+    _with_detected_languages,
+    apply_filters,
+    apply_filters_parallel,
+    compile_pipeline,
+    flat_selected_properties,
+    selected_properties,
+    selected_property_arrays,
+    tokenize_documents,
+)
+from its_prep.types import Document, Filter, Property_Function, detect_languages
 
 
 @given(st.lists(lanst.documents), st.lists(lanst.filters()))
@@ -58,3 +72,186 @@ def test_apply_filters_unsafe(docs: list[Document], filter_funs: list[Filter]):
 def test_selected_properties(docs: list[Document], property_fun: Property_Function):
     for props, doc in zip(selected_properties(docs, property_fun), docs):
         assert len(props) == len(doc.selected)
+        assert props == tuple(
+            prop
+            for index, prop in enumerate(property_fun(doc))
+            if index in doc.selected
+        )
+
+
+@given(st.lists(lanst.documents_with_selections()), lanst.property_funs())
+def test_selected_property_arrays(
+    docs: list[Document], property_fun: Property_Function
+):
+    expected = list(selected_properties(docs, property_fun))
+
+    # fixed-width NumPy strings would drop trailing null characters
+    arrays = selected_property_arrays(docs, property_fun, dtype=object)
+    for props, array in zip(expected, arrays):
+        assert array.tolist() == list(props)
+
+    values, offsets = flat_selected_properties(docs, property_fun, dtype=object)
+    assert len(offsets) == len(docs) + 1
+    for index, props in enumerate(expected):
+        assert values[offsets[index] : offsets[index + 1]].tolist() == list(props)
+
+
+def token_vectors(doc: Document) -> np.ndarray:
+    return np.array(
+        [[len(token), 1.0, 2.0] for token in doc.original_tokens], dtype=np.float32
+    ).reshape(-1, 3)
+
+
+@given(st.lists(lanst.documents, min_size=1, max_size=5))
+def test_flat_selected_vectors(docs: list[Document]):
+    values, offsets = flat_selected_properties(docs, token_vectors)
+    assert values.shape == (offsets[-1], 3)
+
+    # without any selected tokens, the vectors keep their dimension
+    empty_docs = [doc.sub_doc(set()) for doc in docs]
+    values, offsets = flat_selected_properties(empty_docs, token_vectors)
+    assert offsets.tolist() == [0] * (len(docs) + 1)
+    assert values.shape == (0, 3)
+    assert values.dtype == np.float32
+
+
+@given(
+    st.lists(lanst.documents_with_selections()),
+    st.lists(st.one_of(lanst.mask_filters(), lanst.filters(), lanst.filters_unsafe())),
+)
+def test_fused_pipeline_equals_sequential(
+    docs: list[Document], filter_funs: list[Filter]
+):
+    results = list(apply_filters(docs, filter_funs))
+    fused_results = list(apply_filters(docs, filter_funs, fused=True))
+
+    assert results == fused_results
+
+    fused_fun = compile_pipeline(filter_funs)
+    for doc, result in zip(docs, results):
+        assert fused_fun(doc) == result
+
+
+def merged_token_lengths(doc: Document) -> list[int]:
+    # like a property function of merged tokens, some tokens have no value
+    return [len(token) for token in doc.original_tokens[:-1]]
+
+
+@given(st.lists(lanst.documents_with_selections()))
+def test_fused_pipeline_with_short_masks(docs: list[Document]):
+    filter_funs = [
+        filter_specs.get_filter_by_property(merged_token_lengths, {1, 2, 3}),
+        filter_specs.negated(
+            filter_specs.get_filter_by_property(merged_token_lengths, {3})
+        ),
+    ]
+    results = list(apply_filters(docs, filter_funs))
+
+    assert list(apply_filters(docs, filter_funs, fused=True)) == results
+    for doc, result in zip(docs, results):
+        assert result.selected <= set(range(len(doc.original_tokens) - 1))
+
+
+@given(
+    st.lists(lanst.documents_with_selections()),
+    st.lists(st.one_of(lanst.mask_filters(), lanst.filters(), lanst.filters_unsafe())),
+    st.booleans(),
+)
+def test_apply_filters_stats(
+    docs: list[Document], filter_funs: list[Filter], fused: bool
+):
+    stats = Pipeline_Stats()
+    results = list(apply_filters(docs, filter_funs, fused=fused, stats=stats))
+
+    # the measurements do not change the results
+    assert results == list(apply_filters(docs, filter_funs))
+
+    for filter_stats in stats:
+        assert filter_stats.calls <= len(docs)
+        assert 0 <= filter_stats.tokens_out <= filter_stats.tokens_in
+        assert 0 <= filter_stats.selectivity <= 1
+
+    if not fused and docs:
+        assert len(stats.filters) == len(set(filter_funs))
+        # filters only receive the tokens that were kept by previous filters
+        if filter_funs:
+            first, last = stats.filters[filter_funs[0]], stats.filters[filter_funs[-1]]
+            assert first.tokens_in == sum(len(doc) for doc in docs)
+            assert last.tokens_out == sum(len(doc) for doc in results)
+
+
+@given(st.lists(lanst.texts, max_size=10), st.integers(min_value=1, max_value=4))
+@settings(deadline=None)
+def test_tokenize_documents_detects_languages(texts: list[str], batch_size: int):
+    docs = list(tokenize_documents(texts, str.split))
+    assert [doc.language for doc in docs] == detect_languages(texts)
+    assert list(_with_detected_languages(texts, batch_size)) == list(
+        zip(texts, detect_languages(texts))
+    )
+
+    docs = list(tokenize_documents(texts, str.split, language="xx"))
+    assert [doc.language for doc in docs] == ["xx"] * len(texts)
+
+
+def token_lengths(doc: Document) -> list[int]:
+    # module-level property functions can be sent to worker processes
+    return [len(token) for token in doc.original_tokens]
+
+
+@given(st.lists(lanst.documents_with_selections(), max_size=20), st.booleans())
+@settings(deadline=None, max_examples=10)
+def test_apply_filters_parallel(docs: list[Document], ordered: bool):
+    filter_funs = [
+        filter_specs.get_filter_by_property(token_lengths, {1, 2, 3}),
+        filter_specs.negated(filter_specs.get_filter_by_property(token_lengths, {2})),
+    ]
+    # the filters must survive a round-trip through pickle
+    assert pickle.loads(pickle.dumps(filter_funs))
+
+    stats, parallel_stats = Pipeline_Stats(), Pipeline_Stats()
+    results = list(apply_filters(docs, filter_funs, stats=stats))
+    parallel_results = list(
+        apply_filters_parallel(
+            docs,
+            filter_funs,
+            n_jobs=2,
+            chunksize=3,
+            ordered=ordered,
+            stats=parallel_stats,
+        )
+    )
+
+    if ordered:
+        assert parallel_results == results
+    else:
+        assert Counter(parallel_results) == Counter(results)
+
+    # the measurements of the workers are merged
+    def counts(stats: Pipeline_Stats) -> dict:
+        return {
+            fun: (filter_stats.calls, filter_stats.tokens_in, filter_stats.tokens_out)
+            for fun, filter_stats in stats.filters.items()
+        }
+
+    assert counts(parallel_stats) == counts(stats)
+
+
+@given(st.lists(lanst.documents, min_size=1, max_size=30), st.booleans())
+@settings(deadline=None, max_examples=5)
+def test_apply_filters_parallel_reads_lazily(docs: list[Document], ordered: bool):
+    filter_funs = [filter_specs.get_filter_by_property(token_lengths, {1, 2, 3})]
+    num_read = 0
+
+    def read_docs():
+        nonlocal num_read
+        for doc in docs:
+            num_read += 1
+            yield doc
+
+    results = apply_filters_parallel(
+        read_docs(), filter_funs, n_jobs=2, chunksize=2, ordered=ordered
+    )
+    next(results)
+    # at most the pending chunks and the chunk that exceeded them are read
+    assert num_read <= (2 * 2 + 1) * 2
+    results.close()
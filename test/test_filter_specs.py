@@ -3,6 +3,7 @@ from collections.abc import Collection
 
 import hypothesis.strategies as st
 import its_prep.specs.filters as filters
+import numpy as np
 from hypothesis import given
 from its_prep.types import Document, Filter, Property_Function
 from its_prep.utils import nest
@@ -205,3 +206,161 @@ def test_get_words_by_df_in_interval_with_both_rates(
                 assert prop in result
             else:
                 assert prop not in result
+
+
+@given(
+    st.lists(lanst.documents_with_selections(), max_size=10),
+    st.integers(min_value=0, max_value=5),
+    st.booleans(),
+)
+def test_document_frequencies_of_arrays(
+    docs: list[Document], min_num: int, count_only_selected: bool
+):
+    """Integer arrays are counted just like their corresponding lists"""
+
+    def lens_as_list(doc: Document) -> list[int]:
+        return [len(token) for token in doc.original_tokens]
+
+    def lens_as_array(doc: Document) -> np.ndarray:
+        return np.array(lens_as_list(doc), dtype=np.uint64)
+
+    kwargs = dict(min_num=min_num, count_only_selected=count_only_selected)
+    result_list = filters.get_props_by_document_frequency(docs, lens_as_list, **kwargs)
+    result_array = filters.get_props_by_document_frequency(
+        docs, lens_as_array, **kwargs
+    )
+
+    assert result_list == result_array
+
+    dfs, num_docs = filters.count_document_frequencies(
+        docs, lens_as_list, count_only_selected=count_only_selected
+    )
+    assert num_docs == len(docs)
+
+    # counting in small batches gives the same results
+    props, counts, _ = filters._count_document_frequencies_encoded(
+        docs, lens_as_array, count_only_selected=count_only_selected, batch_size=2
+    )
+    assert dict(zip(props, counts.tolist())) == dfs
+
+    for prop, count in dfs.items():
+        assert count == sum(
+            prop in {len(doc.original_tokens[index]) for index in doc.selected}
+            if count_only_selected
+            else prop in lens_as_list(doc)
+            for doc in docs
+        )
+
+
+@given(
+    lanst.documents_with_selections(),
+    st.sets(st.integers(min_value=0, max_value=10)),
+)
+def test_filter_by_property_of_arrays(doc: Document, req_lens: set[int]):
+    """Integer arrays are filtered just like their corresponding lists"""
+
+    def lens_as_list(doc: Document) -> list[int]:
+        return [len(token) for token in doc.original_tokens]
+
+    def lens_as_array(doc: Document) -> np.ndarray:
+        return np.array(lens_as_list(doc), dtype=np.uint64)
+
+    result_list = filters.get_filter_by_property(lens_as_list, req_lens)(doc)
+    result_array = filters.get_filter_by_property(lens_as_array, req_lens)(doc)
+
+    assert result_list == result_array
+    assert set(result_array.selected) == {
+        index for index in doc.selected if len(doc.original_tokens[index]) in req_lens
+    }
+
+
+@given(lanst.documents_with_selections(), st.data())
+def test_filter_by_strings_of_ids(doc: Document, data: st.DataObject):
+    """Strings are filtered in the same way as their spaCy IDs"""
+    from its_prep.spacy.utils import string_ids
+
+    def tokens_as_list(doc: Document) -> list[str]:
+        return list(doc.original_tokens)
+
+    def tokens_as_ids(doc: Document) -> np.ndarray:
+        return string_ids(doc.original_tokens)
+
+    req_tokens = data.draw(st.sets(st.sampled_from(doc.original_tokens or ("",))))
+    result_list = filters.get_filter_by_property(tokens_as_list, req_tokens)(doc)
+    result_ids = filters.get_filter_by_property(tokens_as_ids, req_tokens)(doc)
+
+    assert result_list == result_ids
+
+    # other properties cannot be compared with the IDs
+    try:
+        filters.get_filter_by_property(tokens_as_ids, {"a", -1})(doc)
+        assert False, "IDs must not be compared with arbitrary properties"
+    except TypeError:
+        pass
+
+
+@given(
+    st.lists(lanst.documents_with_selections(), max_size=10),
+    st.integers(min_value=0, max_value=10),
+    lanst.property_funs(),
+    st.integers(min_value=0, max_value=3),
+    st.booleans(),
+)
+def test_document_frequency_index(
+    docs: list[Document],
+    num_removed: int,
+    property_fun: Property_Function,
+    min_num: int,
+    count_only_selected: bool,
+):
+    """The index always agrees with counting the current corpus from scratch"""
+    index = filters.Document_Frequency_Index(
+        property_fun, count_only_selected=count_only_selected
+    )
+    index.add(docs)
+    index.remove(docs[:num_removed])
+    remaining_docs = docs[num_removed:]
+
+    dfs, num_docs = filters.count_document_frequencies(
+        remaining_docs, property_fun, count_only_selected=count_only_selected
+    )
+    assert index.document_freqs == dfs
+    assert index.num_docs == num_docs
+
+    # a batch that cannot be removed as a whole leaves the counts unchanged
+    if dfs:
+        try:
+            index.remove(remaining_docs + remaining_docs)
+            assert False, "documents must not be removed more often than added"
+        except ValueError:
+            pass
+
+        assert index.document_freqs == dfs
+        assert index.num_docs == num_docs
+
+    # documents without properties that were never added cannot be removed
+    try:
+        index.remove([Document.fromtokens([], language="de")] * (num_docs + 1))
+        assert False, "documents that were never added must not be removed"
+    except ValueError:
+        pass
+
+    assert index.document_freqs == dfs
+    assert index.num_docs == num_docs
+
+    assert index.get_props(min_num=min_num) == filters.get_props_by_document_frequency(
+        remaining_docs,
+        property_fun,
+        min_num=min_num,
+        count_only_selected=count_only_selected,
+    )
+
+    frequency_filter = filters.get_filter_by_frequency(
+        remaining_docs,
+        property_fun,
+        min_num=min_num,
+        count_only_selected=count_only_selected,
+    )
+    index_filter = index.get_filter(min_num=min_num)
+    for doc in docs:
+        assert index_filter(doc) == frequency_filter(doc)
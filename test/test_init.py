@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+
+def _modules_after(statement: str) -> set[str]:
+    """The modules that were imported after running the given statement"""
+    result = subprocess.run(
+        [sys.executable, "-c", f"{statement}; import sys; print(*sys.modules)"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_import_is_lazy():
+    modules = _modules_after("import its_prep")
+
+    assert "spacy" not in modules
+    assert "de_core_news_lg" not in modules
+
+
+def test_spacy_model_is_loaded_lazily():
+    modules = _modules_after("import its_prep.spacy; from its_prep import filters")
+
+    assert "de_core_news_lg" not in modules
+
+
+def test_lazy_submodules():
+    import its_prep
+    import its_prep.specs.filters
+
+    assert its_prep.filters is its_prep.specs.filters
+    assert "pipelines" in dir(its_prep)
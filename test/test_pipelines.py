@@ -0,0 +1,66 @@
+import test.strategies as lanst
+from typing import Any
+
+import its_prep.specs.pipelines as pipelines
+from hypothesis import given, settings
+from hypothesis import strategies as st
+from its_prep.core import Pipeline_Stats
+from its_prep.types import Document, Property_Function
+
+
+def is_even_len(doc: Document) -> list[bool]:
+    return [len(token) % 2 == 0 for token in doc.original_tokens]
+
+
+df_intervals = st.fixed_dictionaries(
+    {},
+    optional={
+        "min_num": st.integers(min_value=0, max_value=3),
+        "max_rate": st.floats(min_value=0.0, max_value=1.0),
+        "interval_open": st.booleans(),
+        "count_only_selected": st.booleans(),
+    },
+)
+
+
+@given(
+    st.lists(lanst.documents, max_size=10),
+    lanst.property_funs(),
+    lanst.property_funs(),
+    st.sets(lanst.texts_non_empty, max_size=3),
+    df_intervals,
+    st.booleans(),
+    st.booleans(),
+)
+@settings(deadline=None)
+def test_stream_generic_topic_modeling(
+    docs: list[Document],
+    get_upos_fun: Property_Function[str],
+    lemmatize_fun: Property_Function[str],
+    ignored: set[str],
+    required_df_interval: dict[str, Any],
+    one_shot: bool,
+    fused: bool,
+):
+    kwargs: dict[str, Any] = dict(
+        get_upos_fun=get_upos_fun,
+        is_stop_fun=is_even_len,
+        lemmatize_fun=lemmatize_fun,
+        ignored_upos_tags=ignored,
+        ignored_lemmas=ignored,
+        required_df_interval=required_df_interval,
+    )
+    expected = pipelines.apply_generic_topic_modeling(docs, **kwargs)
+
+    # one-shot iterators can only be consumed once and must be spilled to disk
+    source = iter(docs) if one_shot else docs
+    stats = Pipeline_Stats()
+    results = pipelines.stream_generic_topic_modeling(
+        source, fused=fused, batch_size=3, stats=stats, **kwargs
+    )
+
+    assert list(results) == list(expected)
+
+    # each filter is measured once per document that reaches it
+    for filter_stats in stats:
+        assert filter_stats.calls <= len(docs)
@@ -0,0 +1,98 @@
+import asyncio
+import test.strategies as lanst
+from functools import partial
+from unittest import mock
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+from its_prep.core import apply_filters, tokenize_documents
+import its_prep.serving as serving
+from its_prep.serving import Micro_Batcher
+from its_prep.types import Document, Filter
+
+
+def _keep_even(doc: Document) -> Document:
+    return doc.sub_doc(index for index in doc.selected if index % 2 == 0)
+
+
+def _keep_short(doc: Document, max_len: int = 4) -> Document:
+    return doc.sub_doc(
+        index for index in doc.selected if len(doc.original_tokens[index]) < max_len
+    )
+
+
+def _tokenize(text: str) -> tuple[str, ...]:
+    if text == "fail":
+        raise ValueError(text)
+
+    return tuple(text.split())
+
+
+@given(
+    st.lists(lanst.texts | st.just("fail"), max_size=20),
+    st.lists(st.sampled_from([_keep_even, _keep_short]), max_size=3),
+    st.integers(min_value=1, max_value=8),
+)
+@settings(deadline=None, max_examples=25)
+def test_micro_batcher(texts: list[str], filter_funs: list[Filter], batch_size: int):
+    async def run() -> list[Document | BaseException]:
+        async with Micro_Batcher(
+            filter_funs,
+            tokenize_fun=_tokenize,
+            max_batch_size=batch_size,
+            batch_analysis=False,
+            language="de",
+        ) as batcher:
+            return await asyncio.gather(
+                *(batcher.preprocess(text) for text in texts), return_exceptions=True
+            )
+
+    results = asyncio.run(run())
+    assert len(results) == len(texts)
+
+    # each request is resolved individually, as if it was processed alone
+    for text, result in zip(texts, results):
+        if text == "fail":
+            assert isinstance(result, ValueError)
+            continue
+
+        expected = list(
+            apply_filters(
+                tokenize_documents([text], _tokenize, language="de"), filter_funs
+            )
+        )[0]
+        assert result == expected
+
+
+def _tokenize_documents_alone(texts, tokenize_fun, batch_size=None, **kwargs):
+    # the default batchers of preprocess analyze the texts with spaCy
+    return tokenize_documents(texts, tokenize_fun, **kwargs)
+
+
+@mock.patch.object(serving, "tokenize_documents", _tokenize_documents_alone)
+def test_preprocess_bounds_its_batchers():
+    texts = [f"Text Nummer {index} ist kurz" for index in range(40)]
+
+    async def run() -> list[Document]:
+        # a new pipeline for each request creates a new batcher each time
+        results = [
+            await serving.preprocess(
+                text, [partial(_keep_short, max_len=index % 8)], tokenize_fun=_tokenize
+            )
+            for index, text in enumerate(texts)
+        ]
+
+        loop_batchers = serving._batchers[asyncio.get_running_loop()]
+        assert len(loop_batchers) == serving._MAX_BATCHERS
+        # evicted batchers are closed in the background
+        await asyncio.gather(*serving._closing)
+        assert not serving._closing
+
+        for batcher in list(loop_batchers.values()):
+            await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    for index, (text, result) in enumerate(zip(texts, results)):
+        expected = _keep_short(Document.fromtext(text, _tokenize), max_len=index % 8)
+        assert result == expected
@@ -1,8 +1,11 @@
 import test.strategies as nlp_st
 from collections.abc import Callable
 from pathlib import Path
+from types import SimpleNamespace
 
 import its_prep.spacy.props as nlp
+import its_prep.specs.filters as filter_specs
+import numpy as np
 from hypothesis import given, settings
 from hypothesis import strategies as st
 from its_prep.core import tokenize_documents
@@ -136,9 +139,49 @@ def test_noun_chunks(text: str):
     # property functions must have the same length as the original document
     assert len(chunks) == len(doc)
 
+    # the array-valued version agrees with the list-valued one
+    chunk_ids = nlp.noun_chunk_ids(doc)
+    assert [None if chunk_id < 0 else chunk_id for chunk_id in chunk_ids] == chunks
+
     # test the tokenization using noun chunks
 
 
+class _Chunked_Doc:
+    def __init__(self, num_tokens: int, chunks: list[tuple[int, int]]):
+        self.num_tokens = num_tokens
+        self.noun_chunks = [
+            SimpleNamespace(start=start, end=end) for start, end in chunks
+        ]
+
+    def __len__(self) -> int:
+        return self.num_tokens
+
+
+@given(
+    st.integers(min_value=0, max_value=30).flatmap(
+        lambda num_tokens: st.tuples(
+            st.just(num_tokens),
+            st.lists(
+                st.tuples(
+                    st.integers(min_value=0, max_value=num_tokens),
+                    st.integers(min_value=0, max_value=num_tokens),
+                ).map(sorted)
+            ),
+        )
+    )
+)
+def test_noun_chunk_ids_overlapping(args: tuple[int, list[tuple[int, int]]]):
+    num_tokens, chunks = args
+    chunk_ids = nlp._noun_chunk_id_array(_Chunked_Doc(num_tokens, chunks))
+
+    # each token belongs to the first chunk that contains it
+    for index, chunk_id in enumerate(chunk_ids):
+        containing = [
+            i for i, (start, end) in enumerate(chunks) if start <= index < end
+        ]
+        assert chunk_id == (containing[0] if containing else -1)
+
+
 def test_noun_chunks_without_nouns():
     text = "gehen, laufen, schwimmen"
     doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
@@ -203,3 +246,336 @@ def test_get_word_vectors_with_merging():
     vectors = nlp.get_word_vectors(doc)
 
     assert len(vectors) == len(doc)
+
+
+@given(st.lists(nlp_st.texts, max_size=10), st.integers(min_value=1, max_value=4))
+@settings(deadline=None)
+def test_tokenize_documents_batched(texts: list[str], batch_size: int):
+    # include duplicates, which must not confuse the batched analysis
+    texts = texts + texts[:2]
+    docs = list(tokenize_documents(texts, nlp.tokenize_as_words, batch_size=batch_size))
+
+    assert len(docs) == len(texts)
+    for text, doc in zip(texts, docs):
+        assert doc.original_text == text
+        assert text in nlp.utils._text_cache_original
+        assert doc.original_tokens == nlp.tokenize_as_words(text)
+
+
+@given(st.lists(nlp_st.texts, max_size=10), st.integers(min_value=1, max_value=4))
+@settings(deadline=None)
+def test_bounded_caches(texts: list[str], max_entries: int):
+    nlp.utils.set_cache_limits(max_entries=max_entries)
+    try:
+        for text in texts:
+            doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+            assert len(nlp.utils._text_cache_original) <= max_entries
+            assert len(nlp.is_stop(doc)) == len(doc.original_tokens)
+    finally:
+        nlp.utils.set_cache_limits()
+
+
+def test_evicted_merged_docs_are_rebuilt():
+    text = "Die Bundesrepublik Deutschland grenzt an neun Staaten."
+    doc = list(
+        tokenize_documents([text], nlp.tokenize_as_words, merge_noun_chunks=True)
+    )[0]
+    original_doc = nlp.utils.original_spacy_doc_from_text(text)
+    assert len(doc.original_tokens) < len(original_doc)
+
+    # the merged version is rebuilt, rather than analyzing the tokens again
+    del nlp.utils._text_cache_current[text]
+    processed_doc = nlp.utils.document_into_spacy_doc(doc)
+    assert [token.text for token in processed_doc] == list(doc.original_tokens)
+    assert all(nlp.get_upos(doc))
+
+
+@given(nlp_st.documents_with_selections())
+@settings(deadline=None)
+def test_properties_are_memoized(doc: Document):
+    calls = []
+
+    @nlp.utils.property_from_doc
+    def fun(processed_doc):
+        calls.append(processed_doc)
+        return [token.text for token in processed_doc]
+
+    result = fun(doc)
+    assert fun(doc) is result
+    assert fun(Document.fromtokens(doc.original_tokens)) is result
+    assert len(calls) == 1
+
+
+def test_property_functions_can_be_pickled():
+    import pickle
+
+    for fun in [nlp.get_upos, nlp.is_stop, nlp.lemmatize, nlp.into_sentences]:
+        assert pickle.loads(pickle.dumps(fun)) is fun
+
+
+@given(nlp_st.documents)
+@settings(deadline=None)
+def test_array_properties_match_lists(doc: Document):
+    assert (
+        nlp.get_upos_ids(doc).tolist()
+        == nlp.utils.string_ids(nlp.get_upos(doc)).tolist()
+    )
+    assert (
+        nlp.lemmatize_ids(doc).tolist()
+        == nlp.utils.string_ids(nlp.lemmatize(doc)).tolist()
+    )
+    assert nlp.is_stop_array(doc).tolist() == list(nlp.is_stop(doc))
+
+
+@given(st.lists(nlp_st.documents, max_size=5), nlp_st.documents)
+@settings(deadline=None, max_examples=20)
+def test_property_store(docs: list[Document], other_doc: Document):
+    import pickle
+    import tempfile
+
+    from its_prep.spacy.store import COLUMNS, Property_Store, _column_funs, write_store
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_store(Path(directory), docs)
+        # the store must survive a round-trip through pickle
+        store = pickle.loads(pickle.dumps(Property_Store(Path(directory))))
+
+        assert len(store) == len(set(docs))
+        for doc in docs + [other_doc]:
+            assert (doc in store) == (doc in docs)
+
+            for column in COLUMNS:
+                result = store.get_property_fun(column)(doc)
+                assert list(result) == list(_column_funs[column](doc))
+
+            if doc in docs:
+                lemma_ids = store.get_column("lemma", doc)
+                assert store.decode(lemma_ids) == list(nlp.lemmatize(doc))
+
+            sents = store.get_sentencizer("tokens")(doc)
+            assert sum(len(sent) for sent in sents) == len(doc.original_tokens)
+
+
+@given(nlp_st.texts)
+@settings(deadline=None, max_examples=20)
+def test_shared_caches(text: str):
+    import tempfile
+
+    # documents that were analyzed before the store is used are shared as well
+    tokens = nlp.tokenize_as_words(text)
+
+    with tempfile.TemporaryDirectory() as directory:
+        nlp.utils.use_shared_caches(Path(directory), num_shards=4)
+        try:
+            other_text = text + " Dies ist ein weiterer Satz."
+            other_tokens = nlp.tokenize_as_words(other_text)
+
+            for text, tokens in [(text, tokens), (other_text, other_tokens)]:
+                # forget the analysis in this process only
+                del nlp.utils._text_cache_original[text]
+                assert text in nlp.utils._text_cache_original
+
+                # ... and load it from the shared store
+                processed_doc = nlp.utils.original_spacy_doc_from_text(text)
+                assert tuple(token.text for token in processed_doc) == tokens
+        finally:
+            nlp.utils.use_shared_caches(None)
+
+
+def test_cache_stats():
+    text = "Ein hungriger Hund geht in einem schönen See baden."
+    doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+    nlp.utils.reset_cache_stats()
+
+    nlp.lemmatize(doc)
+    nlp.lemmatize(doc)
+    nlp.into_sentences(doc)
+    nlp.into_sentences(doc)
+
+    stats = nlp.utils.get_cache_stats()
+    assert stats["properties"].hits >= 1
+    assert stats["properties"].size is not None and stats["properties"].size > 0
+    assert stats["sentences"].hits >= 1
+    assert stats["text_original"].entries >= 1
+
+    nlp.utils.reset_cache_stats()
+    stats = nlp.utils.get_cache_stats()
+    assert all(cache.hits == cache.misses == 0 for cache in stats.values())
+
+
+def test_only_components():
+    text = "Der kleine Hund spielt mit dem roten Ball im Garten von Anna Schmidt."
+    components = nlp.utils.get_required_components(nlp.lemmatize_ids, nlp.is_stop)
+    assert "lemmatizer" in components and "parser" not in components
+
+    nlp.utils.clear_caches()
+    with nlp.utils.only_components(components):
+        doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+        applied = nlp.utils.original_spacy_doc_from_text(text).user_data[
+            nlp.utils._COMPONENTS_KEY
+        ]
+        assert "parser" not in applied and "ner" not in applied
+
+        # the disabled components are run on demand
+        lemmas = nlp.lemmatize(doc)
+        chunks = nlp.noun_chunks(doc)
+
+    nlp.utils.clear_caches()
+    doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+    assert nlp.lemmatize(doc) == lemmas
+    assert nlp.noun_chunks(doc) == chunks
+
+
+@given(nlp_st.texts)
+@settings(deadline=None)
+def test_sentence_offsets(text: str):
+    doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+    offsets = nlp.utils.get_sentence_offsets(doc)
+    sents = nlp.into_sentences(doc)
+
+    assert offsets[0] == 0 and offsets[-1] == len(doc.original_tokens)
+    assert [len(sent) for sent in sents] == np.diff(offsets).tolist()
+    assert [token for sent in sents for token in sent] == list(doc.original_tokens)
+
+    # the same sentences as those of the sentencized spaCy document
+    if len(doc.original_tokens) > 0:
+        spacy_sents = nlp.utils.sentencizer_from_doc(
+            lambda processed_doc: [
+                [token.text for token in sent] for sent in processed_doc.sents
+            ]
+        )
+        assert [list(sent) for sent in sents] == spacy_sents(doc)
+
+    # lengths from the offsets match those of the split sentences
+    with_offsets = filter_specs.get_filter_by_subset_len(nlp.into_sentences, 3, 10)
+    without_offsets = filter_specs.get_filter_by_subset_len(
+        lambda doc: nlp.into_sentences(doc), 3, 10
+    )
+    assert with_offsets(doc) == without_offsets(doc)
+
+
+def test_sentence_offsets_with_later_components():
+    text = "Der Hund schläft im Garten. Die Katze spielt dort! Und dann?"
+    nlp.utils.clear_caches()
+    components = nlp.utils.get_required_components(nlp.into_sentences)
+    assert "parser" not in components
+
+    with nlp.utils.only_components(components):
+        doc = list(tokenize_documents([text], nlp.tokenize_as_words))[0]
+        sents = nlp.into_sentences(doc)
+        offsets = nlp.utils.get_sentence_offsets(doc).tolist()
+
+        # the sentences do not require the parser
+        processed_doc = nlp.utils.document_into_spacy_doc(doc)
+        assert not nlp.utils._was_applied(processed_doc, "parser")
+
+        # running the parser later on does not change the sentences
+        nlp.noun_chunks(doc)
+        assert nlp.utils._was_applied(processed_doc, "parser")
+        nlp.utils._sents_cache.clear()
+        assert nlp.utils.get_sentence_offsets(doc).tolist() == offsets
+        assert nlp.into_sentences(doc) == sents
+
+
+def test_word_vector_matrices():
+    import spacy
+    from its_prep.spacy.vectors import document_embeddings, selected_word_vectors
+
+    # a small vector table, such that the expected vectors are known
+    model = spacy.blank("de")
+    model.vocab.set_vector("Hund", np.array([1.0, 0.0], dtype=np.float32))
+    model.vocab.set_vector("Katze", np.array([0.0, 2.0], dtype=np.float32))
+    model.vocab.set_vector("Maus", np.array([4.0, 4.0], dtype=np.float32))
+
+    previous_model = nlp.utils._nlp
+    nlp.utils.set_nlp(model)
+    nlp.utils.clear_caches()
+    try:
+        docs = [
+            Document.fromtokens(["Hund", "Katze", "Hund", "Maus"], language="de"),
+            Document.fromtokens(["Katze", "Vogel"], language="de"),
+            Document.fromtokens(["Maus"], language="de"),
+        ]
+        # only the selected tokens are pooled
+        docs = [docs[0].sub_doc({0, 1, 2}), docs[1], docs[2].sub_doc(set())]
+
+        matrix = nlp.get_word_vector_matrix(docs[0])
+        assert np.array_equal(matrix, [[1, 0], [0, 2], [1, 0], [4, 4]])
+        for row, vector in zip(matrix, nlp.get_word_vectors(docs[0])):
+            assert np.array_equal(row, vector)
+
+        # strings without a vector are assigned zeros
+        assert np.array_equal(nlp.get_word_vector_matrix(docs[1]), [[0, 2], [0, 0]])
+
+        vectors, offsets = selected_word_vectors(docs)
+        assert np.array_equal(vectors, [[1, 0], [0, 2], [1, 0], [0, 2], [0, 0]])
+        assert offsets.tolist() == [0, 3, 5, 5]
+
+        mean_embeddings = document_embeddings(docs)
+        assert np.allclose(mean_embeddings, [[2 / 3, 2 / 3], [0, 1], [0, 0]])
+
+        # the document frequencies are 1 for Hund and Vogel and 2 for Katze
+        idf_once, idf_twice = np.log(4 / 2) + 1, np.log(4 / 3) + 1
+        tfidf_embeddings = document_embeddings(docs, weighting="tfidf")
+        assert np.allclose(
+            tfidf_embeddings,
+            [
+                np.array([2 * idf_once, 2 * idf_twice]) / (2 * idf_once + idf_twice),
+                [0, 2 * idf_twice / (idf_twice + idf_once)],
+                [0, 0],
+            ],
+        )
+    finally:
+        if previous_model is None:
+            nlp.utils._nlp = None
+        else:
+            nlp.utils.set_nlp(previous_model)
+        nlp.utils.clear_caches()
+
+
+def _worker_config() -> tuple[dict, tuple[int, int]]:
+    return (
+        nlp.utils.get_process_config(include_model=False),
+        nlp.utils.get_nlp().vocab.vectors.shape,
+    )
+
+
+def test_process_config():
+    import multiprocessing
+    import tempfile
+
+    import spacy
+
+    model = spacy.blank("de")
+    model.vocab.set_vector("Hund", np.array([1.0, 0.0], dtype=np.float32))
+
+    previous_model = nlp.utils._nlp
+    nlp.utils.set_nlp(model)
+    nlp.utils.set_cache_limits(max_entries=8)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            nlp.utils.use_shared_caches(Path(directory), num_shards=4)
+            with nlp.utils.only_components(["tok2vec"]):
+                config = nlp.utils.get_process_config()
+                assert config["nlp"] is model
+
+                # spawned processes do not inherit the configuration
+                context = multiprocessing.get_context("spawn")
+                with context.Pool(
+                    1, initializer=nlp.utils.set_process_config, initargs=(config,)
+                ) as pool:
+                    worker_config, shape = pool.apply(_worker_config)
+
+                assert worker_config == nlp.utils.get_process_config(
+                    include_model=False
+                )
+                assert worker_config["enabled_components"] == {"tok2vec"}
+                assert shape == model.vocab.vectors.shape
+    finally:
+        nlp.utils.use_shared_caches(None)
+        nlp.utils.set_cache_limits()
+        if previous_model is None:
+            nlp.utils._nlp = None
+        else:
+            nlp.utils.set_nlp(previous_model)
+        nlp.utils.clear_caches()
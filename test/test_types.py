@@ -1,6 +1,21 @@
+import dataclasses
+import pickle
 from collections.abc import Callable, Collection, Iterable, Set
-from its_prep.types import Document, Tokens
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import FrozenInstanceError
+
+import its_prep.types as types
+from its_prep.types import (
+    Document,
+    Interned_Tokens,
+    Selection,
+    Tokens,
+    content_digest,
+    detect_languages,
+    intern_tokens,
+)
 from test.strategies import documents, texts, tokenizers, tokens
+import numpy as np
 from hypothesis import given, strategies as st
 
 
@@ -32,6 +47,34 @@ def test_document_languages():
     assert Document.fromtokens(tokens).language == "de"
 
 
+def test_document_languages_lazy_and_explicit():
+    tokens = "Dies ist ein deutscher Text".split(" ")
+    doc = Document.fromtokens(tokens, lazy_language=True)
+    sub_doc = doc.sub_doc({0, 1})
+    assert doc == Document.fromtokens(tokens, lazy_language=True)
+    assert doc._language is None and sub_doc._language is None
+    assert doc.language == sub_doc.language == "de"
+    assert doc == Document.fromtokens(tokens)
+
+    assert Document.fromtokens(tokens, language="xx").language == "xx"
+
+
+@given(st.lists(texts))
+def test_detect_languages(texts: list[str]):
+    assert detect_languages(texts) == [
+        Document.make(text, (), ()).language for text in texts
+    ]
+
+
+def test_detected_languages_are_cached_by_digest():
+    text = "Dies ist ein deutscher Text"
+    assert detect_languages([text, text]) == ["de", "de"]
+
+    # the cache does not keep the texts themselves
+    assert types._languages[content_digest(text)] == "de"
+    assert text not in types._languages
+
+
 @given(documents, st.sets(st.integers(min_value=0)))
 def test_document_sub_doc(doc: Document, index_set: Set[int]):
     result = doc.sub_doc(index_set)
@@ -51,6 +94,86 @@ def test_document_sub_doc(doc: Document, index_set: Set[int]):
         assert expected_token in result.selected_tokens
 
 
+@given(documents, documents, st.sets(st.integers(min_value=0)))
+def test_document_digest(doc: Document, other_doc: Document, index_set: Set[int]):
+    sub_doc = doc.sub_doc(index_set)
+    assert sub_doc.digest == doc.digest
+    assert doc.digest == content_digest(doc.original_text, *doc.original_tokens)
+
+    # equality and hashing are consistent with the contents
+    copy = Document.make(doc.original_text, doc.original_tokens, doc.selected)
+    assert copy == doc and hash(copy) == hash(doc)
+    assert (sub_doc == doc) == (sub_doc.selected == doc.selected)
+
+    same_contents = (doc.original_text, doc.original_tokens) == (
+        other_doc.original_text,
+        other_doc.original_tokens,
+    )
+    assert (doc.digest == other_doc.digest) == same_contents
+
+
+@given(documents, st.sets(st.integers(min_value=0)))
+def test_compact_document(doc: Document, index_set: Set[int]):
+    compact = doc.compact()
+    assert isinstance(compact.original_tokens, Interned_Tokens)
+    assert not hasattr(compact, "__dict__")
+    try:
+        compact.selected = Selection()  # type: ignore[misc]
+        assert False, "documents must be immutable"
+    except FrozenInstanceError:
+        pass
+
+    # compact documents behave like the original ones
+    assert compact == doc and hash(compact) == hash(doc)
+    assert compact.digest == doc.digest
+    assert compact.original_tokens == doc.original_tokens
+    assert list(compact.original_tokens) == list(doc.original_tokens)
+    assert compact.selected_tokens == doc.selected_tokens
+    assert compact.sub_doc(index_set) == doc.sub_doc(index_set)
+    assert pickle.loads(pickle.dumps(compact)) == compact
+
+    # each distinct token string is only stored once
+    other = Document.fromtokens(
+        list(doc.original_tokens), language=doc.language, compact=True
+    )
+    assert other == compact
+    assert all(
+        token is other_token
+        for token, other_token in zip(compact.original_tokens, other.original_tokens)
+    )
+
+
+@given(documents, st.sets(st.integers(min_value=0)))
+def test_document_dataclass_functions(doc: Document, index_set: Set[int]):
+    assert [field.name for field in dataclasses.fields(doc)] == [
+        "original_text",
+        "original_tokens",
+        "selected",
+        "language",
+    ]
+    assert dataclasses.asdict(doc) == {
+        "original_text": doc.original_text,
+        "original_tokens": doc.original_tokens,
+        "selected": doc.selected,
+        "language": doc.language,
+    }
+    sub_doc = doc.sub_doc(index_set)
+    assert dataclasses.replace(doc, selected=sub_doc.selected) == sub_doc
+    assert dataclasses.replace(doc.compact(), language="xx").language == "xx"
+
+
+def test_intern_tokens_concurrently():
+    tokens = [f"token {index % 100}" for index in range(1000)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(intern_tokens, [tokens] * 32))
+
+    # each distinct token string gets exactly one ID, even across threads
+    for result in results:
+        assert np.array_equal(result.ids, results[0].ids)
+        assert list(result) == tokens
+    assert len(np.unique(results[0].ids)) == 100
+
+
 @given(documents)
 def test_document_is_iterable(doc: Document):
     assert isinstance(doc, Iterable)
@@ -68,3 +191,45 @@ def test_document_iterator(doc: Document):
     # to the result of the document's iterator
     assert len(tokens) == len(doc)
     assert set(tokens) == set(doc)
+
+
+@given(
+    st.frozensets(st.integers(min_value=0, max_value=50)),
+    st.frozensets(st.integers(min_value=0, max_value=50)),
+)
+def test_selection_behaves_like_frozenset(a: frozenset[int], b: frozenset[int]):
+    sel_a, sel_b = Selection(a), Selection(b)
+
+    assert sel_a == a
+    assert hash(sel_a) == hash(a)
+    assert list(sel_a) == sorted(a)
+    assert len(sel_a) == len(a)
+
+    assert sel_a & sel_b == a & b
+    assert sel_a | sel_b == a | b
+    assert sel_a - sel_b == a - b
+    assert sel_a & b == a & b
+    assert sel_a - b == a - b
+    assert sel_a.issubset(sel_b) == a.issubset(b)
+    assert sel_a.issubset(b) == a.issubset(b)
+    assert sel_a.issuperset(sel_b) == a.issuperset(b)
+    assert sel_a.issuperset(list(b)) == a.issuperset(b)
+
+    assert sel_a.union(b, [-1]) == a.union(b, [-1])
+    assert sel_a.union(["x"]) == a.union(["x"])
+    assert sel_a.intersection(sel_b, range(25)) == a.intersection(b, range(25))
+    assert sel_a.difference(list(b), {0}) == a.difference(b, {0})
+    assert sel_a.copy() == a.copy()
+    assert isinstance(sel_a.union(sel_b), Selection)
+
+    for index in range(-1, 52):
+        assert (index in sel_a) == (index in a)
+
+
+@given(documents, st.sets(st.integers(min_value=0)))
+def test_document_selected_tokens_are_ordered(doc: Document, index_set: Set[int]):
+    result = doc.sub_doc(index_set)
+
+    assert result.selected_tokens == tuple(
+        token for index, token in enumerate(doc.original_tokens) if index in index_set
+    )
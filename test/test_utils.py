@@ -0,0 +1,152 @@
+import multiprocessing
+import pickle
+import tempfile
+from pathlib import Path
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+from its_prep.utils import Keyed_defaultdict, Sharded_Doc_Store
+
+import spacy.tokens
+import spacy.vocab
+
+
+@given(st.lists(st.integers(max_value=20)), st.integers(min_value=1, max_value=10))
+def test_keyed_defaultdict_max_entries(keys: list[int], max_entries: int):
+    cache = Keyed_defaultdict(lambda x: -x, max_entries=max_entries)
+
+    for key in keys:
+        assert cache[key] == -key
+        assert len(cache) <= max_entries
+
+    # the most recently used entries are kept
+    recent_keys = list(dict.fromkeys(reversed(keys)))[:max_entries]
+    assert set(cache.keys()) == set(recent_keys)
+
+    stats = cache.stats
+    assert stats.hits + stats.misses == len(keys)
+    assert stats.misses - stats.evictions == stats.entries == len(cache)
+
+    cache.reset_stats()
+    assert cache.stats.hits == cache.stats.misses == cache.stats.evictions == 0
+
+
+@given(
+    st.lists(st.text(max_size=10)),
+    st.integers(min_value=0, max_value=30),
+)
+def test_keyed_defaultdict_max_size(keys: list[str], max_size: int):
+    cache = Keyed_defaultdict(lambda x: x, max_size=max_size, size_fun=len)
+
+    for key in keys:
+        assert cache[key] == key
+        assert cache.total_size <= max_size
+        assert cache.total_size == sum(len(value) for value in cache.values())
+
+
+@given(st.lists(st.text(max_size=10)), st.integers(min_value=0, max_value=30))
+def test_keyed_defaultdict_total_size(keys: list[str], max_size: int):
+    cache = Keyed_defaultdict(lambda x: x, max_size=max_size, size_fun=len)
+
+    for key in keys:
+        assert cache.setdefault(key, key) == cache.get(key, key)
+        assert cache.total_size == sum(len(value) for value in cache.values())
+
+    while cache:
+        cache.popitem()
+        assert cache.total_size == sum(len(value) for value in cache.values())
+
+    assert cache.total_size == 0
+
+
+@given(st.lists(st.integers()), st.integers(min_value=0, max_value=10))
+def test_keyed_defaultdict_set_limits(keys: list[int], max_entries: int):
+    cache = Keyed_defaultdict(lambda x: x)
+    for key in keys:
+        cache[key]
+
+    assert len(cache) == len(set(keys))
+
+    cache.set_limits(max_entries=max_entries)
+    assert len(cache) == min(len(set(keys)), max_entries)
+
+    cache.set_limits()
+    for key in keys:
+        cache[key]
+
+    assert len(cache) == len(set(keys))
+
+
+@given(st.lists(st.text(max_size=5)), st.integers(min_value=1, max_value=10))
+def test_keyed_defaultdict_key_fun(keys: list[str], max_entries: int):
+    cache = Keyed_defaultdict(lambda x: x.upper(), max_entries=max_entries, key_fun=len)
+
+    for key in keys:
+        # entries are shared between keys with the same stored key
+        expected = cache.get(key, key.upper())
+        assert cache[key] == expected
+        assert key in cache
+        assert len(cache) <= max_entries
+
+    # only the stored keys are kept
+    assert set(cache.keys()) <= {len(key) for key in keys}
+    assert cache.copy() == cache
+
+    for key in keys:
+        cache.pop(key, None)
+        assert key not in cache
+
+    assert len(cache) == cache.total_size == 0
+
+
+@given(st.lists(st.text(max_size=5)))
+def test_keyed_defaultdict_files(keys: list[str]):
+    cache = Keyed_defaultdict(lambda x: x.upper(), key_fun=len)
+    for key in keys:
+        cache[key]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "cache"
+        cache.save(path)
+        loaded = Keyed_defaultdict.from_file(cache.default_factory, path, key_fun=len)
+        assert loaded == cache
+
+        # files without a format version contain the original keys
+        with open(path, "wb") as f:
+            pickle.dump({key: cache[key] for key in keys}, f)
+        loaded = Keyed_defaultdict.from_file(cache.default_factory, path, key_fun=len)
+        assert loaded == cache
+
+
+def _open_store(directory: Path) -> int:
+    return Sharded_Doc_Store(directory, num_shards=4).num_shards
+
+
+def _put_words(args: tuple[Path, int, list[str]]) -> None:
+    directory, key, words = args
+    store = Sharded_Doc_Store(directory, num_shards=4)
+    store.put(key, spacy.tokens.Doc(spacy.vocab.Vocab(), words=words))
+
+
+@given(st.lists(st.lists(st.text(min_size=1, max_size=5), max_size=5), max_size=8))
+@settings(deadline=None, max_examples=10)
+def test_sharded_doc_store(words_list: list[list[str]]):
+    with tempfile.TemporaryDirectory() as directory:
+        # each document is written twice, by concurrent processes
+        args = [(Path(directory), key, words) for key, words in enumerate(words_list)]
+        with multiprocessing.Pool(2) as pool:
+            # concurrent processes may create the store at the same time
+            assert pool.map(_open_store, [Path(directory)] * 4) == [4] * 4
+            pool.map(_put_words, args + args)
+
+        store = Sharded_Doc_Store(Path(directory))
+        assert store.num_shards == 4
+        assert len(store) == len(words_list)
+
+        for key, words in enumerate(words_list):
+            assert key in store
+            doc = store.get(key, spacy.vocab.Vocab())
+            assert doc is not None
+            assert [token.text for token in doc] == words
+
+        assert store.get(len(words_list), spacy.vocab.Vocab()) is None